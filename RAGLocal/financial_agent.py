@@ -4,12 +4,17 @@ Financial Agent Conversation System with RAG Integration
 Handles conversations, guardrails, and conversation management
 """
 
-import json
+import operator
 import re
 import os
+import struct
+import msgspec
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter, Retry
+from collections import OrderedDict, deque
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
 import logging
 
@@ -20,6 +25,21 @@ from rag_system import LocalPGVectorRAG, DocumentMetadata
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Shared msgspec encoder/decoder (much faster than stdlib json on the
+# conversation save path, which runs on every turn)
+_JSON_ENCODER = msgspec.json.Encoder()
+_JSON_DECODER = msgspec.json.Decoder()
+
+# MessagePack codec for the append-only conversation log. Each message is
+# written as a 4-byte big-endian length header followed by the encoded frame.
+_MSGPACK_ENCODER = msgspec.msgpack.Encoder()
+_MSGPACK_DECODER = msgspec.msgpack.Decoder()
+_FRAME_HEADER = struct.Struct('>I')
+
+# Fixed source fields extracted from RAG results
+_SOURCE_KEYS = ('pdf_name', 'pdf_link', 'year', 'doc_type', 'similarity')
+_GET_SOURCE = operator.itemgetter(*_SOURCE_KEYS)
+
 @dataclass
 class ConversationMessage:
     """Individual conversation message"""
@@ -51,32 +71,44 @@ class FinancialGuardrails:
             'savings': ['savings', 'emergency fund', 'budgeting', 'financial planning'],
             'banking': ['bank', 'checking', 'savings account', 'cd', 'money market']
         }
-    
+
+        # Precompile the keyword set into a single alternation so matching is
+        # one C-level regex scan instead of nested Python loops per query.
+        # Deliberately unanchored: the baseline used substring checks, so
+        # "banking" must still hit 'bank' and "taxation" 'tax'; longest
+        # keywords first so overlapping alternatives resolve the same way
+        self._keyword_to_category = {
+            keyword: category
+            for category, keywords in self.financial_keywords.items()
+            for keyword in keywords
+        }
+        alternation = '|'.join(
+            re.escape(keyword)
+            for keyword in sorted(self._keyword_to_category, key=len, reverse=True)
+        )
+        self._keyword_pattern = re.compile('(' + alternation + ')', re.IGNORECASE)
+
+        # Stable integer id per category so topic counts can be accumulated
+        # as arrays instead of dict increments
+        self.category_ids = {category: i for i, category in enumerate(self.financial_keywords)}
+
+    def topic_ids(self, query: str) -> List[int]:
+        """Distinct category ids matched in the query"""
+        return sorted({
+            self.category_ids[self._keyword_to_category[match.group(1).lower()]]
+            for match in self._keyword_pattern.finditer(query)
+        })
+
     def is_financial_query(self, query: str) -> bool:
         """Check if query is financial-related"""
-        query_lower = query.lower()
-        
-        for category, keywords in self.financial_keywords.items():
-            for keyword in keywords:
-                if keyword in query_lower:
-                    return True
-        
-        return False
-    
+        return self._keyword_pattern.search(query) is not None
+
     def count_complex_keywords(self, query: str) -> int:
-        """Count financial keywords to detect complex queries"""
-        query_lower = query.lower()
-        keyword_count = 0
-        
-        for category, keywords in self.financial_keywords.items():
-            category_found = False
-            for keyword in keywords:
-                if keyword in query_lower and not category_found:
-                    keyword_count += 1
-                    category_found = True
-                    break
-        
-        return keyword_count
+        """Count distinct financial areas to detect complex queries"""
+        return len({
+            self._keyword_to_category[match.group(1).lower()]
+            for match in self._keyword_pattern.finditer(query)
+        })
     
     def is_too_complex(self, query: str) -> bool:
         """Check if query is too complex (3+ different financial areas)"""
@@ -90,17 +122,43 @@ class FinancialAgent:
         self.api_key = "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"#api_key or os.getenv('NVIDIA_API_KEY')
         self.api_url = "https://integrate.api.nvidia.com/v1/chat/completions"
         self.model_name = "meta/llama-3.1-405b-instruct"
-        
+
+        # Persistent HTTP session with keep-alive so repeated LLM calls reuse
+        # the TLS connection instead of paying handshake latency every turn
+        self._http = requests.Session()
+        self._http.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[429, 502, 503, 504])
+        )
+        self._http.mount("https://", adapter)
+
+
         # Initialize RAG system
         self.rag_system = LocalPGVectorRAG(db_config)
         
         # Initialize guardrails
         self.guardrails = FinancialGuardrails()
         
-        # Conversation storage
-        self.conversation_file = "financial_conversations.json"
+        # Conversation storage (append-only MessagePack log, one frame per message)
+        self.conversation_file = "financial_conversations.mpk"
         self.summary_file = "summarize.json"
         self.conversation_count = 0
+        self._conversation_log = open(self.conversation_file, 'ab')
+
+        # LRU cache over the RAG pipeline keyed by normalized query; a hit
+        # skips HyDE generation, the embedding, and the pgvector scan
+        self._rag_cache: OrderedDict = OrderedDict()
+        self._rag_cache_size = 256
+
+        # Cache of composed system messages keyed by context hash; follow-up
+        # turns frequently reuse the same RAG context verbatim
+        self._system_message_cache: OrderedDict = OrderedDict()
+        self._system_message_cache_size = 64
         
         # System prompt for financial domain
         self.system_prompt = """You are a helpful financial assistant specializing in personal finance, investments, banking, insurance, loans, retirement planning, and tax matters.
@@ -123,23 +181,51 @@ Focus on:
 
 If the query is not financial-related, politely redirect to financial topics."""
     
-    def _load_conversations(self) -> List[Dict[str, Any]]:
-        """Load existing conversations"""
-        try:
-            if os.path.exists(self.conversation_file):
-                with open(self.conversation_file, 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            logger.error(f"Failed to load conversations: {e}")
-        return []
-    
-    def _save_conversations(self, conversations: List[Dict[str, Any]]):
-        """Save conversations to file"""
+    def _append_message(self, record: Dict[str, Any]):
+        """Append a single length-prefixed MessagePack frame to the log"""
+        payload = _MSGPACK_ENCODER.encode(record)
+        self._conversation_log.write(_FRAME_HEADER.pack(len(payload)))
+        self._conversation_log.write(payload)
+        self._conversation_log.flush()
+
+    def _rehydrate_sessions(self) -> List[Dict[str, Any]]:
+        """Stream the conversation log and rebuild per-session dicts"""
+        sessions: Dict[str, Dict[str, Any]] = {}
         try:
-            with open(self.conversation_file, 'w') as f:
-                json.dump(conversations, f, indent=2)
+            with open(self.conversation_file, 'rb') as f:
+                while True:
+                    header = f.read(_FRAME_HEADER.size)
+                    if len(header) < _FRAME_HEADER.size:
+                        break
+                    record = _MSGPACK_DECODER.decode(f.read(_FRAME_HEADER.unpack(header)[0]))
+
+                    session = sessions.get(record['session_id'])
+                    if session is None:
+                        session = {
+                            'session_id': record['session_id'],
+                            'timestamp': record['timestamp'],
+                            'model': self.model_name,
+                            'domain': 'financial',
+                            'messages': []
+                        }
+                        sessions[record['session_id']] = session
+
+                    message = {
+                        'role': record['role'],
+                        'content': record['content'],
+                        'timestamp': record['timestamp'],
+                        'sources': record.get('sources')
+                    }
+                    if record.get('topic_ids') is not None:
+                        message['topic_ids'] = record['topic_ids']
+                    session['messages'].append(message)
+                    session['total_messages'] = len(session['messages'])
+                    session['last_updated'] = record['timestamp']
+        except FileNotFoundError:
+            pass
         except Exception as e:
-            logger.error(f"Failed to save conversations: {e}")
+            logger.error(f"Failed to rehydrate conversations: {e}")
+        return list(sessions.values())
     
     def _generate_summary(self, conversations: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Generate summary of conversations"""
@@ -150,27 +236,28 @@ If the query is not financial-related, politely redirect to financial topics."""
         total_conversations = len(conversations)
         total_messages = sum(len(conv.get('messages', [])) for conv in conversations)
         
-        # Count topics discussed
-        topics = {
-            'investment': 0, 'retirement': 0, 'tax': 0, 'insurance': 0,
-            'loans': 0, 'savings': 0, 'banking': 0
-        }
-        
+        # Count topics discussed via the per-message topic ids (precomputed
+        # at write time, recomputed here only for legacy messages)
+        topic_names = list(self.guardrails.financial_keywords)
+        all_topic_ids = []
+
         recent_queries = []
-        
+
         for conv in conversations[-10:]:  # Last 10 conversations
             for msg in conv.get('messages', []):
                 if msg['role'] == 'user':
-                    query = msg['content'].lower()
                     recent_queries.append(msg['content'])
-                    
-                    # Count topics
-                    for topic, keywords in self.guardrails.financial_keywords.items():
-                        if topic in topics:
-                            for keyword in keywords:
-                                if keyword in query:
-                                    topics[topic] += 1
-                                    break
+
+                    topic_ids = msg.get('topic_ids')
+                    if topic_ids is None:
+                        topic_ids = self.guardrails.topic_ids(msg['content'])
+                    all_topic_ids.extend(topic_ids)
+
+        counts = np.bincount(
+            np.asarray(all_topic_ids, dtype=np.int32),
+            minlength=len(topic_names)
+        )
+        topics = {name: int(counts[i]) for i, name in enumerate(topic_names)}
         
         return {
             'generated_at': datetime.now().isoformat(),
@@ -186,70 +273,105 @@ If the query is not financial-related, politely redirect to financial topics."""
         try:
             existing_summaries = []
             if os.path.exists(self.summary_file):
-                with open(self.summary_file, 'r') as f:
-                    existing_summaries = json.load(f)
-            
+                with open(self.summary_file, 'rb') as f:
+                    existing_summaries = _JSON_DECODER.decode(f.read())
+
             existing_summaries.append(summary)
-            
-            with open(self.summary_file, 'w') as f:
-                json.dump(existing_summaries, f, indent=2)
+
+            with open(self.summary_file, 'wb') as f:
+                f.write(_JSON_ENCODER.encode(existing_summaries))
                 
             logger.info("Conversation summary saved")
         except Exception as e:
             logger.error(f"Failed to save summary: {e}")
     
-    def _get_rag_context(self, query: str) -> str:
-        """Get relevant context from RAG system"""
+    def _get_rag_context(self, query: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """Get relevant context and raw results from RAG system"""
+        cache_key = query.strip().lower()
+        cached = self._rag_cache.get(cache_key)
+        if cached is not None:
+            self._rag_cache.move_to_end(cache_key)
+            return cached
+
         try:
             results = self.rag_system.search_documents(query, limit=3, use_hyde=True)
-            
+
             if not results:
-                return "No relevant financial documents found."
-            
-            context = "Based on financial documents:\n\n"
-            for i, result in enumerate(results, 1):
-                context += f"{i}. From {result['pdf_name']} ({result['year']}, {result['doc_type']}):\n"
-                context += f"{result['content']}\n\n"
-            
-            return context
+                value = ("No relevant financial documents found.", [])
+            else:
+                parts = ["Based on financial documents:"]
+                parts.extend(
+                    f"{i}. From {result['pdf_name']} ({result['year']}, {result['doc_type']}):\n{result['content']}"
+                    for i, result in enumerate(results, 1)
+                )
+                value = ("\n\n".join(parts) + "\n\n", results)
+
+            self._rag_cache[cache_key] = value
+            if len(self._rag_cache) > self._rag_cache_size:
+                self._rag_cache.popitem(last=False)
+            return value
         except Exception as e:
             logger.error(f"RAG context retrieval failed: {e}")
-            return "Unable to retrieve relevant financial documents."
+            return "Unable to retrieve relevant financial documents.", []
     
-    def _call_llm(self, messages: List[Dict[str, str]], context: str = "") -> str:
-        """Call the LLM with context"""
+    def _call_llm(self, messages: List[Dict[str, str]], context: str = "",
+                  on_token=None) -> str:
+        """Call the LLM with context, streaming tokens to on_token if given"""
         if not self.api_key:
             return "Error: No API key configured for the financial agent."
         
-        # Prepare messages with context
-        system_message = self.system_prompt
-        if context:
-            system_message += f"\n\nRELEVANT FINANCIAL CONTEXT:\n{context}"
-        
-        llm_messages = [{"role": "system", "content": system_message}] + messages
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
+        # Prepare the system message with context, reusing the cached dict
+        # when the same context repeats across turns
+        cache_key = hash(context)
+        system_message = self._system_message_cache.get(cache_key)
+        if system_message is None:
+            if context:
+                content = "\n\nRELEVANT FINANCIAL CONTEXT:\n".join((self.system_prompt, context))
+            else:
+                content = self.system_prompt
+            system_message = {"role": "system", "content": content}
+            self._system_message_cache[cache_key] = system_message
+            if len(self._system_message_cache) > self._system_message_cache_size:
+                self._system_message_cache.popitem(last=False)
+        else:
+            self._system_message_cache.move_to_end(cache_key)
+
+        llm_messages = [system_message] + messages
+
         payload = {
             "model": self.model_name,
             "messages": llm_messages,
             "temperature": 0.3,
-            "max_tokens": 1000
+            "max_tokens": 1000,
+            "stream": True
         }
-        
+
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
-            result = response.json()
-            return result['choices'][0]['message']['content'].strip()
+            # Stream tokens as they arrive so time-to-first-token is low;
+            # the full response is still accumulated for the caller
+            tokens = []
+            with self._http.post(self.api_url, data=_JSON_ENCODER.encode(payload),
+                                 stream=True, timeout=60) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line.startswith(b"data: "):
+                        continue
+                    data = line[6:]
+                    if data == b"[DONE]":
+                        break
+                    chunk = _JSON_DECODER.decode(data)
+                    token = chunk['choices'][0]['delta'].get('content')
+                    if token:
+                        tokens.append(token)
+                        if on_token:
+                            on_token(token)
+            return ''.join(tokens).strip()
         except Exception as e:
             logger.error(f"LLM call failed: {e}")
             return f"I apologize, but I'm experiencing technical difficulties. Please try again later. Error: {str(e)}"
     
-    def process_query(self, query: str, conversation_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+    def process_query(self, query: str, conversation_history: List[Dict[str, str]] = None,
+                      on_token=None) -> Dict[str, Any]:
         """Process a financial query with guardrails and RAG"""
         timestamp = datetime.now().isoformat()
         
@@ -257,17 +379,18 @@ If the query is not financial-related, politely redirect to financial topics."""
         if conversation_history is None:
             conversation_history = []
         
-        # Apply guardrails
-        if not self.guardrails.is_financial_query(query):
+        # Apply guardrails with a single keyword scan over the query
+        financial_categories = self.guardrails.count_complex_keywords(query)
+        if financial_categories == 0:
             return {
                 'response': "I'm a financial assistant and can only help with questions about personal finance, investments, banking, insurance, loans, retirement planning, and tax matters. Could you please ask a financial question?",
                 'sources': [],
                 'timestamp': timestamp,
                 'guardrail_triggered': 'non_financial'
             }
-        
-        # Check for complex queries
-        if self.guardrails.is_too_complex(query):
+
+        # Check for complex queries (3+ different financial areas)
+        if financial_categories >= 3:
             return {
                 'response': "Kindly contact Fin Advisor. Your query involves multiple complex financial areas that would benefit from personalized professional consultation.",
                 'sources': [],
@@ -275,35 +398,23 @@ If the query is not financial-related, politely redirect to financial topics."""
                 'guardrail_triggered': 'too_complex'
             }
         
-        # Get RAG context
-        context = self._get_rag_context(query)
-        
+        # Get RAG context and raw results in a single search
+        context, rag_results = self._get_rag_context(query)
+
         # Prepare conversation for LLM
         messages = conversation_history + [{"role": "user", "content": query}]
-        
+
         # Get LLM response
-        response = self._call_llm(messages, context)
-        
-        # Extract source information
-        sources = []
-        try:
-            rag_results = self.rag_system.search_documents(query, limit=3, use_hyde=True)
-            for result in rag_results:
-                sources.append({
-                    'pdf_name': result['pdf_name'],
-                    'pdf_link': result['pdf_link'],
-                    'year': result['year'],
-                    'doc_type': result['doc_type'],
-                    'similarity': result['similarity']
-                })
-        except Exception as e:
-            logger.error(f"Failed to extract sources: {e}")
+        response = self._call_llm(messages, context, on_token=on_token)
+
+        # Extract source information from the same search results
+        sources = [dict(zip(_SOURCE_KEYS, _GET_SOURCE(result))) for result in rag_results]
         
         return {
             'response': response,
             'sources': sources,
             'timestamp': timestamp,
-            'context_used': bool(context and "No relevant" not in context),
+            'context_used': bool(rag_results),
             'guardrail_triggered': None
         }
     
@@ -315,57 +426,35 @@ If the query is not financial-related, politely redirect to financial topics."""
     
     def save_conversation_turn(self, session_id: str, user_message: str, 
                              agent_response: Dict[str, Any]):
-        """Save a conversation turn"""
+        """Save a conversation turn by appending two frames to the log"""
         try:
-            conversations = self._load_conversations()
-            
-            # Find or create conversation session
-            session = None
-            for conv in conversations:
-                if conv.get('session_id') == session_id:
-                    session = conv
-                    break
-            
-            if not session:
-                session = {
-                    'session_id': session_id,
-                    'timestamp': datetime.now().isoformat(),
-                    'model': self.model_name,
-                    'domain': 'financial',
-                    'messages': []
-                }
-                conversations.append(session)
-            
-            # Add user message
-            session['messages'].append({
+            # Append user message (topic ids precomputed for the summary pass)
+            self._append_message({
+                'session_id': session_id,
                 'role': 'user',
                 'content': user_message,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now().isoformat(),
+                'sources': None,
+                'topic_ids': self.guardrails.topic_ids(user_message)
             })
-            
-            # Add agent response
-            session['messages'].append({
+
+            # Append agent response
+            self._append_message({
+                'session_id': session_id,
                 'role': 'assistant',
                 'content': agent_response['response'],
                 'timestamp': agent_response['timestamp'],
                 'sources': agent_response.get('sources', [])
             })
-            
-            # Update session info
-            session['total_messages'] = len(session['messages'])
-            session['last_updated'] = datetime.now().isoformat()
-            
-            # Save conversations
-            self._save_conversations(conversations)
-            
+
             # Check if we need to create a summary (every 5 conversations)
             self.conversation_count += 1
             if self.conversation_count % 5 == 0:
-                summary = self._generate_summary(conversations)
+                summary = self._generate_summary(self._rehydrate_sessions())
                 self._save_summary(summary)
-            
+
             logger.info(f"Conversation turn saved for session {session_id}")
-            
+
         except Exception as e:
             logger.error(f"Failed to save conversation turn: {e}")
 
@@ -386,7 +475,8 @@ def main():
     # Interactive mode
     if len(sys.argv) > 1 and sys.argv[1] == "interactive":
         session_id = agent.start_conversation()
-        conversation_history = []
+        # Keep last 10 messages for context; maxlen evicts older ones in O(1)
+        conversation_history = deque(maxlen=10)
         
         print("Financial Agent Chat (type 'quit' to exit)")
         print("=" * 50)
@@ -401,12 +491,27 @@ def main():
                 if not user_input:
                     continue
                 
-                # Process query
-                response = agent.process_query(user_input, conversation_history)
-                
-                # Display response
-                print(f"\nAgent: {response['response']}")
-                
+                # Process query, streaming tokens to the terminal as they arrive
+                print("\nAgent: ", end="", flush=True)
+                streamed = []
+
+                def _print_token(token):
+                    streamed.append(True)
+                    print(token, end="", flush=True)
+
+                response = agent.process_query(
+                    user_input, list(conversation_history),
+                    on_token=_print_token
+                )
+
+                # Anything that bypassed streaming - guardrail replies, but
+                # also the apology a failed LLM call returns whole - gets
+                # printed here so the prefix is never left blank
+                if streamed:
+                    print()
+                else:
+                    print(response['response'])
+
                 if response.get('sources'):
                     print("\nSources:")
                     for i, source in enumerate(response['sources'], 1):
@@ -418,11 +523,7 @@ def main():
                 # Update conversation history
                 conversation_history.append({"role": "user", "content": user_input})
                 conversation_history.append({"role": "assistant", "content": response['response']})
-                
-                # Keep last 10 messages for context
-                if len(conversation_history) > 10:
-                    conversation_history = conversation_history[-10:]
-                
+
             except KeyboardInterrupt:
                 print("\n\nGoodbye!")
                 break
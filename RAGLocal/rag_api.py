@@ -1,19 +1,77 @@
 # rag_api.py - FastAPI RAG Service for Remote Access
+import asyncio
+import asyncpg
+from collections import OrderedDict
 import uvicorn
+from pgvector.asyncpg import register_vector
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import sys
 import os
 import json
-from sentence_transformers import SentenceTransformer
 from rag_system import LocalPGVectorRAG, OCRConfig
 
-app = FastAPI(title="Financial RAG API", version="1.0.0")
+app = FastAPI(title="Financial RAG API", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Global RAG system instance
 rag_system = None
 
+# Micro-batching: concurrent queries arriving within BATCH_WINDOW_S are
+# encoded together (batched matmul is far faster than per-item encode)
+# and resolved with a single SQL round trip.
+BATCH_WINDOW_S = 0.005
+MAX_BATCH = 32
+
+query_queue: Optional[asyncio.Queue] = None
+batch_worker_task = None
+
+# asyncpg pool for the hot query path; the pgvector codec lets query
+# embeddings travel as binary arrays instead of Python lists
+db_pool: Optional[asyncpg.Pool] = None
+
+# Column order of the batch search rows returned to clients
+_ROW_KEYS = ('content', 'pdf_name', 'pdf_link', 'year', 'doc_type',
+             'chunk_index', 'ocr_processed', 'similarity')
+
+# HyDE generation is a full LLM round trip; cache outputs per normalized
+# query and collapse concurrent duplicates into one upstream call
+HYDE_CACHE_SIZE = 512
+_hyde_cache: OrderedDict = OrderedDict()
+_hyde_inflight: Dict[str, asyncio.Future] = {}
+
+
+async def _hyde_for_query(query: str) -> str:
+    """Return the (cached) HyDE document for a query, single-flight"""
+    key = query.strip().lower()
+
+    cached = _hyde_cache.get(key)
+    if cached is not None:
+        _hyde_cache.move_to_end(key)
+        return cached
+
+    inflight = _hyde_inflight.get(key)
+    if inflight is not None:
+        return await inflight
+
+    future = asyncio.get_running_loop().create_future()
+    _hyde_inflight[key] = future
+    try:
+        hyde_text = await asyncio.to_thread(
+            rag_system.hyde_generator.generate_hypothetical_document, query
+        )
+        _hyde_cache[key] = hyde_text
+        if len(_hyde_cache) > HYDE_CACHE_SIZE:
+            _hyde_cache.popitem(last=False)
+        future.set_result(hyde_text)
+        return hyde_text
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _hyde_inflight.pop(key, None)
+
 class RAGQuery(BaseModel):
     query: str
     limit: int = 5
@@ -25,11 +83,77 @@ class RAGResponse(BaseModel):
     total_results: int
     processing_info: Dict[str, Any]
 
+BATCH_SEARCH_SQL = """
+SELECT q.idx, d.content, d.pdf_name, d.pdf_link, d.year, d.doc_type,
+       d.chunk_index, d.ocr_processed, d.similarity
+FROM unnest($1::halfvec[]) WITH ORDINALITY AS q(qvec, idx)
+JOIN LATERAL (
+    SELECT content, pdf_name, pdf_link, year, doc_type, chunk_index, ocr_processed,
+           -(embedding <#> q.qvec) AS similarity
+    FROM financial_documents
+    ORDER BY embedding <#> q.qvec
+    LIMIT $2
+) d ON TRUE
+"""
+
+
+async def _init_db_connection(conn: asyncpg.Connection):
+    """Register the pgvector codec on each pooled connection"""
+    await register_vector(conn)
+
+
+async def _run_batch_search(embeddings, max_limit: int) -> List[List[tuple]]:
+    """Resolve a batch of query embeddings with one SQL round trip"""
+    async with db_pool.acquire() as conn:
+        # asyncpg prepares and caches the statement per connection, so the
+        # query is parsed/planned once instead of on every call
+        rows = await conn.fetch(BATCH_SEARCH_SQL, list(embeddings), max_limit)
+
+    grouped: List[List[tuple]] = [[] for _ in embeddings]
+    for row in rows:
+        grouped[row['idx'] - 1].append(tuple(row)[1:])
+    return grouped
+
+
+async def batch_worker():
+    """Coalesce queued queries, batch-encode, and run one SQL query per batch"""
+    loop = asyncio.get_running_loop()
+
+    while True:
+        batch = [await query_queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_S
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(query_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        try:
+            texts = [hyde_text for hyde_text, _, _, _ in batch]
+            embeddings = await asyncio.to_thread(
+                rag_system.embedding_model.encode,
+                texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True
+            )
+            max_limit = max(limit for _, _, limit, _ in batch)
+            grouped = await _run_batch_search(embeddings, max_limit)
+
+            for (_, threshold, limit, future), rows in zip(batch, grouped):
+                if not future.done():
+                    future.set_result([row for row in rows if row[-1] > threshold][:limit])
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize RAG system on startup"""
-    global rag_system
-    
+    global rag_system, query_queue, batch_worker_task, db_pool
+
     print("Initializing RAG system...")
     
     try:
@@ -57,11 +181,31 @@ async def startup_event():
             ocr_config=ocr_config
         )
         
-        # Force CPU usage for embedding model
-        rag_system.embedding_model = SentenceTransformer('mukaj/fin-mpnet-base', device='cpu')
-        
+        # Keep the device LocalPGVectorRAG selected (GPU when compatible);
+        # on CUDA, run the encoder in FP16 to halve memory traffic. The
+        # ONNX CPU backend has no torch device, hence the getattr guard.
+        device = getattr(rag_system.embedding_model, 'device', None)
+        if device is not None and device.type == 'cuda':
+            rag_system.embedding_model.half()
+
+        # Async connection pool for the hot query path
+        db_pool = await asyncpg.create_pool(
+            host=db_config['host'],
+            database=db_config['database'],
+            user=db_config['user'],
+            password=db_config['password'],
+            port=db_config['port'],
+            min_size=2,
+            max_size=16,
+            init=_init_db_connection
+        )
+
+        # Start the micro-batching worker
+        query_queue = asyncio.Queue()
+        batch_worker_task = asyncio.get_running_loop().create_task(batch_worker())
+
         print("RAG system initialized successfully!")
-        
+
     except Exception as e:
         print(f"Failed to initialize RAG system: {e}")
         raise
@@ -99,51 +243,21 @@ async def query_rag(request: RAGQuery):
         raise HTTPException(status_code=503, detail="RAG system not initialized")
     
     try:
-        # Generate HyDE text and embedding
-        hyde_text = rag_system.hyde_generator.generate_hypothetical_document(request.query)
-        query_embedding = rag_system.embedding_model.encode(hyde_text)
-        
-        # Build SQL query
-        sql = """
-        SELECT content, pdf_name, pdf_link, year, doc_type, chunk_index, ocr_processed,
-        1 - (embedding <=> %s::vector) AS similarity
-        FROM financial_documents
-        WHERE 1 - (embedding <=> %s::vector) > %s
-        ORDER BY similarity DESC
-        LIMIT %s
-        """
-        
-        params = [
-            query_embedding.tolist(), 
-            query_embedding.tolist(),
-            request.similarity_threshold,
-            request.limit
-        ]
-        
-        # Execute query
-        conn = rag_system.connection_pool.getconn()
-        cursor = conn.cursor()
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
-        cursor.close()
-        rag_system.connection_pool.putconn(conn)
-        
-        # Format results
-        results = []
-        for row in rows:
-            content, pdf_name, pdf_link, year, doc_type, chunk_index, ocr_processed, similarity = row
-            results.append({
-                "content": content,
-                "pdf_name": pdf_name,
-                "pdf_link": pdf_link,
-                "year": year,
-                "doc_type": doc_type,
-                "chunk_index": chunk_index,
-                "ocr_processed": ocr_processed,
-                "similarity": float(similarity),
-                "preview": content[:300].strip() + "..." if len(content) > 300 else content
-            })
-        
+        # Generate (or reuse) the HyDE text for this query
+        hyde_text = await _hyde_for_query(request.query)
+
+        # Hand the query to the batching worker and await its slice of the batch
+        future = asyncio.get_running_loop().create_future()
+        await query_queue.put((hyde_text, request.similarity_threshold, request.limit, future))
+        rows = await future
+
+        # Format results against the fixed row keys, then attach previews
+        results = [dict(zip(_ROW_KEYS, row)) for row in rows]
+        for result in results:
+            content = result["content"]
+            result["similarity"] = float(result["similarity"])
+            result["preview"] = content[:300].strip() + "..." if len(content) > 300 else content
+
         return RAGResponse(
             query=request.query,
             results=results,
@@ -170,7 +284,13 @@ async def query_rag_get(
     return await query_rag(request)
 
 if __name__ == "__main__":
+    import uvloop
+    uvloop.install()
+
     print("Starting Financial RAG API Server...")
     print("Make sure PostgreSQL with pgvector is running")
     print("API will be available at http://localhost:8001")
-    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
\ No newline at end of file
+    uvicorn.run(
+        app, host="0.0.0.0", port=8001, log_level="info",
+        loop="uvloop", http="httptools", limit_concurrency=256
+    )
\ No newline at end of file
@@ -4,10 +4,62 @@
 Query Script for Local PGVector RAG System (CPU-only, top 5 chunks)
 """
 
+import atexit
 import sys
-from sentence_transformers import SentenceTransformer
+import threading
+from pgvector.psycopg2 import register_vector
 from rag_system import LocalPGVectorRAG, OCRConfig
 
+# Physical connections that already carry our prepared statements
+_PREPARED_CONNS = set()
+
+# One pooled connection per thread, registered and tuned exactly once
+_TLS = threading.local()
+
+
+def _get_query_connection(rag):
+    """Return this thread's pooled connection, checked out and set up once.
+
+    register_vector and SET hnsw.ef_search run on first checkout only; the
+    connection stays pinned to the thread and goes back to the pool at exit.
+    """
+    conn = getattr(_TLS, 'conn', None)
+    if conn is None:
+        conn = rag.connection_pool.getconn()
+        register_vector(conn)
+        cursor = conn.cursor()
+        cursor.execute("SET SESSION hnsw.ef_search = 40")
+        conn.commit()
+        cursor.close()
+        _TLS.conn = conn
+        atexit.register(rag.connection_pool.putconn, conn)
+    return conn
+
+
+def _ensure_prepared(cursor, conn):
+    """PREPARE the hot statements once per physical connection.
+
+    EXECUTE skips the per-query parse/plan of the ANN ORDER BY; ordering by
+    the distance operator directly keeps the HNSW index usable.
+    """
+    if id(conn) in _PREPARED_CONNS:
+        return
+    cursor.execute("""
+        PREPARE rag_topk(halfvec, int) AS
+        SELECT id, -(embedding <#> $1) AS similarity
+        FROM financial_documents
+        ORDER BY embedding <#> $1
+        LIMIT $2
+    """)
+    cursor.execute("""
+        PREPARE rag_fetch(int[]) AS
+        SELECT id, content, pdf_name, pdf_link, year, doc_type, chunk_index, ocr_processed
+        FROM financial_documents
+        WHERE id = ANY($1)
+    """)
+    _PREPARED_CONNS.add(id(conn))
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python rag_query.py \"<your query>\"")
@@ -24,30 +76,33 @@ def main():
     }
 
     ocr_config = OCRConfig(use_ocr=True, ocr_language='eng', dpi=300, use_ocrmypdf=True)
+    # LocalPGVectorRAG loads the model once (CPU fallback included); the old
+    # device='cpu' override here loaded the 420 MB model a second time
     rag = LocalPGVectorRAG(db_config, model_name='mukaj/fin-mpnet-base', ocr_config=ocr_config)
-    rag.embedding_model = SentenceTransformer('mukaj/fin-mpnet-base', device='cpu')
 
-    # Generate HyDE text and embedding
+    # Generate HyDE text and embedding (normalized to match stored vectors)
     hyde_text = rag.hyde_generator.generate_hypothetical_document(query)
-    query_embedding = rag.embedding_model.encode(hyde_text)
+    query_embedding = rag.embedding_model.encode(hyde_text, normalize_embeddings=True)
 
-    # Build SQL correctly with two placeholders
-    sql = """
-        SELECT content, pdf_name, pdf_link, year, doc_type, chunk_index, ocr_processed,
-               1 - (embedding <=> %s::vector) AS similarity
-        FROM financial_documents
-        ORDER BY similarity DESC
-        LIMIT %s
-    """
-    params = [query_embedding.tolist(), 5]
+    # Stage 1: ANN scan over the HNSW index returning only (id, similarity);
+    # Stage 2: fetch full rows for the few winning ids. Keeps the heavy
+    # content column out of the vector scan.
+    vector = query_embedding.tolist()
 
-    # Execute
-    conn = rag.connection_pool.getconn()
+    # Execute on the thread's persistent connection (ef_search already set)
+    conn = _get_query_connection(rag)
     cursor = conn.cursor()
-    cursor.execute(sql, params)
-    rows = cursor.fetchall()
+    _ensure_prepared(cursor, conn)
+    cursor.execute("EXECUTE rag_topk(%s::halfvec, %s)", [vector, 5])
+    hits = cursor.fetchall()
+    rows_by_id = {}
+    if hits:
+        cursor.execute("EXECUTE rag_fetch(%s)", ([hit_id for hit_id, _ in hits],))
+        rows_by_id = {row[0]: row[1:] for row in cursor.fetchall()}
+    conn.commit()
     cursor.close()
-    rag.connection_pool.putconn(conn)
+
+    rows = [rows_by_id[hit_id] + (similarity,) for hit_id, similarity in hits]
 
     # Display
     print(f"\nTop {len(rows)} chunks for query: \"{query}\"\n" + "="*60)
@@ -1,8 +1,22 @@
 import requests
+from requests.adapters import HTTPAdapter, Retry
 
 NGROK_URL = "http://0.0.0.0:8001"
 API_ENDPOINT = f"{NGROK_URL.rstrip('/')}/query"
 
+# Module-level session: keep-alive connections are reused across calls
+# instead of paying a TCP/TLS handshake per query
+_SESSION = requests.Session()
+_SESSION.mount('http://', HTTPAdapter(
+    pool_connections=10, pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=10, pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
+_SESSION.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip'})
+
 def fetch_documents(query: str, limit: int = 5, similarity_threshold: float = 0.0):
     data = {
         "query": query,
@@ -10,7 +24,7 @@ def fetch_documents(query: str, limit: int = 5, similarity_threshold: float = 0.
         "similarity_threshold": similarity_threshold
     }
     try:
-        response = requests.post(API_ENDPOINT, json=data, timeout=30)
+        response = _SESSION.post(API_ENDPOINT, json=data, timeout=30)
         response.raise_for_status()
         raw_results = response.json()
     except requests.exceptions.RequestException as e:
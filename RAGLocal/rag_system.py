@@ -4,26 +4,35 @@ Enhanced RAG System with OCR Support for Scanned PDFs
 Includes Tesseract OCR, pdf2image, and OCRmyPDF integration
 """
 
+import io
 import os
 import sys
 import json
 import hashlib
 import logging
+import multiprocessing
+import sqlite3
 import tempfile
 import warnings
 import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import List, Dict, Any, Optional, Tuple
 import re
 
 import fitz  # pymupdf
 import numpy as np
 import psycopg2
+from psycopg2.extras import NamedTupleCursor, execute_values
 from psycopg2.pool import SimpleConnectionPool
+from pgvector import HalfVector
 from pgvector.psycopg2 import register_vector
 from sentence_transformers import SentenceTransformer
 import requests
+from requests.adapters import HTTPAdapter
 import torch
 
 # OCR related imports
@@ -43,6 +52,22 @@ except ImportError:
     OCRMYPDF_AVAILABLE = False
     logging.warning("OCRmyPDF not available. Install with: pip install ocrmypdf")
 
+# Optional: BLAKE3 for dedup hashing (SIMD, several times faster than
+# SHA-256; dedup keys need no cryptographic margin)
+try:
+    import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+
+# Optional: int8 ONNX Runtime embedding backend (3-4x CPU throughput on
+# VNNI hardware); falls back to the FP32 SentenceTransformer path
+try:
+    from rag_pipeline import HAS_ONNX as _PIPELINE_HAS_ONNX, ONNXEmbeddingModel
+    ONNX_EMBED_AVAILABLE = _PIPELINE_HAS_ONNX
+except ImportError:
+    ONNX_EMBED_AVAILABLE = False
+
 # Suppress CUDA warnings for unsupported GPUs
 warnings.filterwarnings("ignore", message=".*CUDA capability.*")
 warnings.filterwarnings("ignore", message=".*Quadro M2200.*")
@@ -51,6 +76,14 @@ warnings.filterwarnings("ignore", message=".*Quadro M2200.*")
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Word tokenizer for chunking, compiled once at import
+_WS_RE = re.compile(r"\S+")
+
+# Embedding precision at the Python/DB boundary. fp16 matches the halfvec
+# column so nothing is lost, and halves the bytes serialized per row;
+# set EMBEDDING_PRECISION=fp32 to keep full precision in transit.
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "fp16")
+
 @dataclass
 class DocumentMetadata:
     """Metadata for financial documents"""
@@ -77,57 +110,110 @@ class OCRConfig:
     use_ocrmypdf: bool = True  # Prefer ocrmypdf over manual approach
     ocr_timeout: int = 300  # OCR timeout in seconds
 
+# Keep-alive session for HyDE calls: each cold requests.post pays a TCP +
+# TLS handshake to the NVIDIA endpoint before any tokens flow
+_HYDE_SESSION = requests.Session()
+_HYDE_SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+@lru_cache(maxsize=1024)
+def _generate_hyde_document(api_key: str, api_url: str, query: str, domain: str) -> str:
+    """Memoized HyDE call: repeat queries skip the seconds-long LLM round trip"""
+    prompt = f"""
+    Write a detailed financial document that would answer this question: {query}
+
+    Focus on providing comprehensive information about:
+    - Financial metrics and analysis
+    - Market conditions and trends
+    - Investment strategies and recommendations
+    - Risk assessments and considerations
+    - Regulatory and compliance aspects
+
+    Write as if this is an excerpt from a professional financial report or analysis.
+    """
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+    payload = {
+        "model": "meta/llama-3.1-8b-instruct",
+        "messages": [
+            {"role": "system", "content": "You are a financial analyst writing professional financial documents."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.7,
+        "max_tokens": 300
+    }
+
+    try:
+        response = _HYDE_SESSION.post(api_url, headers=headers, json=payload, timeout=30)
+        response.raise_for_status()
+        result = response.json()
+        return result['choices'][0]['message']['content'].strip()
+    except Exception as e:
+        logger.error(f"HyDE generation failed: {e}")
+        return query  # Fallback to original query
+
+
 class HyDEGenerator:
     """Generates hypothetical documents for improved retrieval"""
-    
+
     def __init__(self, api_key: str = None):
         """Initialize HyDE generator with optional API key"""
-        self.api_key = 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#api_key or os.getenv('NVIDIA_API_KEY')
+        self.api_key = "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"#api_key or os.getenv('NVIDIA_API_KEY')
         self.api_url = "https://integrate.api.nvidia.com/v1/chat/completions"
-        
+
     def generate_hypothetical_document(self, query: str, domain: str = "financial") -> str:
         """Generate a hypothetical document for the given query"""
-        
+
         if not self.api_key:
             logger.warning("No API key provided for HyDE. Using query as-is.")
             return query
-            
-        prompt = f"""
-        Write a detailed financial document that would answer this question: {query}
-        
-        Focus on providing comprehensive information about:
-        - Financial metrics and analysis
-        - Market conditions and trends  
-        - Investment strategies and recommendations
-        - Risk assessments and considerations
-        - Regulatory and compliance aspects
-        
-        Write as if this is an excerpt from a professional financial report or analysis.
-        """
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "meta/llama-3.1-8b-instruct",
-            "messages": [
-                {"role": "system", "content": "You are a financial analyst writing professional financial documents."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7,
-            "max_tokens": 300
-        }
-        
-        try:
-            response = requests.post(self.api_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            result = response.json()
-            return result['choices'][0]['message']['content'].strip()
-        except Exception as e:
-            logger.error(f"HyDE generation failed: {e}")
-            return query  # Fallback to original query
+
+        return _generate_hyde_document(self.api_key, self.api_url, query, domain)
+
+def _ocr_page(args):
+    """OCR a single rasterized page in a worker process.
+
+    Returns (text, mean_confidence) so the caller can decide whether the
+    page needs a higher-DPI retry. Text is rebuilt from image_to_data so
+    confidence comes from the same Tesseract pass.
+    """
+    image_path, lang = args
+    # One Tesseract per worker; its OpenMP threads scale poorly and would
+    # oversubscribe the pool
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    image = Image.open(image_path)
+    data = pytesseract.image_to_data(
+        image, config=r'--oem 3 --psm 3 -l ' + lang,
+        output_type=pytesseract.Output.DICT
+    )
+
+    lines = []
+    current_key = None
+    current_words = []
+    confidences = []
+    for word, conf, block, line in zip(
+            data['text'], data['conf'], data['block_num'], data['line_num']):
+        if not word.strip():
+            continue
+        key = (block, line)
+        if key != current_key and current_words:
+            lines.append(' '.join(current_words))
+            current_words = []
+        current_key = key
+        current_words.append(word)
+        conf = float(conf)
+        if conf >= 0:
+            confidences.append(conf)
+    if current_words:
+        lines.append(' '.join(current_words))
+
+    mean_conf = sum(confidences) / len(confidences) if confidences else 0.0
+    return '\n'.join(lines), mean_conf
+
 
 class OCRProcessor:
     """Handles OCR processing for scanned PDFs"""
@@ -180,18 +266,26 @@ class OCRProcessor:
             pages_to_check = min(3, len(doc))
             text_chars = 0
             image_count = 0
-            
+
             for page_num in range(pages_to_check):
                 page = doc.load_page(page_num)
-                
-                # Count text characters
-                text = page.get_text()
+
+                # Count text characters; flags=0 skips MuPDF's layout
+                # analysis since only the length matters here
+                text = page.get_text("text", flags=0)
                 text_chars += len(text.strip())
-                
-                # Count images
-                image_list = page.get_images()
-                image_count += len(image_list)
-            
+
+                # Clearly enough text to rule out a scanned PDF; stop
+                # probing further pages
+                if text_chars > 300:
+                    doc.close()
+                    logger.info(f"PDF analysis - {text_chars} text chars in first "
+                               f"{page_num + 1} page(s), likely scanned: False")
+                    return False
+
+                # Count images without parsing the full xref table
+                image_count += len(page.get_image_info(xrefs=False))
+
             doc.close()
             
             # Heuristic: if very little text but images present, likely scanned
@@ -233,14 +327,10 @@ class OCRProcessor:
                 timeout=self.config.ocr_timeout
             )
             
-            # Extract text from OCR'd PDF
+            # Extract text from OCR'd PDF; join once instead of quadratic
+            # += concatenation across pages
             doc = fitz.open(temp_path)
-            text = ""
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text += page.get_text() + "\n"
-            
+            text = "\n".join(page.get_text() for page in doc)
             doc.close()
             
             logger.info("OCRmyPDF processing completed successfully")
@@ -256,45 +346,78 @@ class OCRProcessor:
             except:
                 pass
     
-    def _ocr_with_tesseract(self, pdf_path: str) -> str:
-        """Use Tesseract directly via pdf2image"""
+    def _rasterize_pages(self, pdf_path: str, tmpdir: str, dpi: int,
+                         pages: Optional[List[int]] = None) -> List[str]:
+        """Rasterize pages to disk; paths_only keeps peak memory at one
+        page per worker instead of the whole document as PIL images"""
+        if pages is None:
+            return convert_from_path(
+                pdf_path, dpi=dpi, fmt='jpeg',
+                output_folder=tmpdir, paths_only=True
+            )
+        paths = []
+        for page_num in pages:
+            paths.extend(convert_from_path(
+                pdf_path, dpi=dpi, fmt='jpeg',
+                output_folder=tmpdir, paths_only=True,
+                first_page=page_num + 1, last_page=page_num + 1
+            ))
+        return paths
+
+    def _ocr_with_tesseract(self, pdf_path: str,
+                            pages: Optional[List[int]] = None) -> List[str]:
+        """Use Tesseract directly via pdf2image; returns text per page.
+
+        First pass runs at reduced DPI (Tesseract cost scales with pixel
+        count, so 200 vs 300 DPI is ~2x faster); only pages whose mean
+        word confidence comes back low are re-OCR'd at full DPI.
+        """
         if not OCR_AVAILABLE:
             raise Exception("OCR libraries not available")
-            
+
         logger.info("Converting PDF to images for OCR...")
-        
+        first_pass_dpi = min(200, self.config.dpi)
+        # One Tesseract per ~4 cores by default; OCR_CONCURRENCY overrides
+        # for boxes where ingest is the only workload
+        workers = int(os.getenv("OCR_CONCURRENCY", max(1, (os.cpu_count() or 1) // 4)))
+
         try:
-            # Convert PDF to images
-            images = convert_from_path(
-                pdf_path,
-                dpi=self.config.dpi,
-                fmt='jpeg'
-            )
-            
-            logger.info(f"Converted PDF to {len(images)} images")
-            
-            # OCR each page
-            extracted_text = []
-            
-            for i, image in enumerate(images):
-                logger.info(f"OCR processing page {i+1}/{len(images)}")
-                
-                # Configure Tesseract
-                custom_config = r'--oem 3 --psm 3 -l ' + self.config.ocr_language
-                
-                # Extract text from image
-                text = pytesseract.image_to_string(image, config=custom_config)
-                extracted_text.append(text)
-            
-            # Combine all text
-            full_text = "\n".join(extracted_text)
-            
+            with tempfile.TemporaryDirectory() as tmpdir:
+                image_paths = self._rasterize_pages(pdf_path, tmpdir, first_pass_dpi, pages)
+                page_numbers = pages if pages is not None else list(range(len(image_paths)))
+
+                # OCR pages in parallel, roughly one Tesseract per 4 cores;
+                # workers load their own page image and map() preserves order
+                jobs = [(path, self.config.ocr_language) for path in image_paths]
+                logger.info(f"Running OCR on {len(jobs)} pages with {workers} workers")
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(_ocr_page, jobs))
+
+                # Retry low-confidence pages at full DPI
+                retry = [i for i, (_, conf) in enumerate(results) if conf < 60]
+                if retry and self.config.dpi > first_pass_dpi:
+                    logger.info(f"Re-running {len(retry)} low-confidence pages at {self.config.dpi} DPI")
+                    retry_paths = self._rasterize_pages(
+                        pdf_path, tmpdir, self.config.dpi,
+                        [page_numbers[i] for i in retry]
+                    )
+                    retry_jobs = [(path, self.config.ocr_language) for path in retry_paths]
+                    with ProcessPoolExecutor(max_workers=workers) as executor:
+                        retried = list(executor.map(_ocr_page, retry_jobs))
+                    for i, (text, conf) in zip(retry, retried):
+                        if conf > results[i][1]:
+                            results[i] = (text, conf)
+
             logger.info("Tesseract OCR processing completed successfully")
-            return full_text
-            
+            return [text for text, _ in results]
+
         except Exception as e:
             logger.error(f"Tesseract OCR failed: {e}")
             raise
+
+    def ocr_page_texts(self, pdf_path: str, pages: List[int]) -> List[str]:
+        """OCR only the given 0-based pages, returning text per page"""
+        return self._ocr_with_tesseract(pdf_path, pages=pages)
     
     def extract_text_with_ocr(self, pdf_path: str) -> str:
         """Extract text from PDF using OCR if needed"""
@@ -312,7 +435,7 @@ class OCRProcessor:
         
         # Fallback to manual Tesseract approach
         if OCR_AVAILABLE:
-            return self._ocr_with_tesseract(pdf_path)
+            return "\n".join(self._ocr_with_tesseract(pdf_path))
         else:
             raise Exception("No OCR method available")
 
@@ -335,8 +458,14 @@ class LocalPGVectorRAG:
         try:
             # Force CPU if CUDA is not compatible
             if not torch.cuda.is_available() or not self._is_cuda_compatible():
-                logger.info("Using CPU for embeddings (CUDA not available or incompatible)")
-                self.embedding_model = SentenceTransformer(model_name, device='cpu')
+                if ONNX_EMBED_AVAILABLE:
+                    # int8 ONNX Runtime runs 3-4x faster than FP32 torch on
+                    # CPU; the wrapper mirrors the encode() interface
+                    logger.info("Using int8 ONNX Runtime backend for embeddings (CPU)")
+                    self.embedding_model = ONNXEmbeddingModel(model_name)
+                else:
+                    logger.info("Using CPU for embeddings (CUDA not available or incompatible)")
+                    self.embedding_model = SentenceTransformer(model_name, device='cpu')
             else:
                 self.embedding_model = SentenceTransformer(model_name)
                 
@@ -349,6 +478,19 @@ class LocalPGVectorRAG:
             self.embedding_model = SentenceTransformer(model_name, device='cpu')
             self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
         
+        # Persistent embedding cache: re-ingested PDFs and repeated query
+        # strings skip the transformer forward pass on warm runs
+        self._emb_cache_db = sqlite3.connect("embedding_cache.db", check_same_thread=False)
+        self._emb_cache_db.execute("PRAGMA journal_mode=WAL")
+        self._emb_cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache (key BLOB PRIMARY KEY, embedding BLOB)"
+        )
+        self._emb_cache_db.commit()
+
+        # Small executor for overlapping the HyDE LLM round trip with the
+        # speculative raw-query scan in search_documents
+        self._hyde_executor = ThreadPoolExecutor(max_workers=2)
+
         # Initialize database connection pool
         self.connection_pool = self._create_connection_pool()
         
@@ -357,6 +499,20 @@ class LocalPGVectorRAG:
         
     def _setup_device(self):
         """Setup device for embeddings"""
+        # Pin CPU inference threads: MKL/OpenMP otherwise spawns one thread
+        # per core for a batch-1 encode, which oversubscribes badly once
+        # ingest runs process-parallel. RAG_TORCH_THREADS overrides; note
+        # OMP_NUM_THREADS/MKL_NUM_THREADS only take full effect when set
+        # before the first torch import.
+        torch.set_num_threads(
+            int(os.getenv("RAG_TORCH_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+        )
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # already fixed once parallel work has started
+            pass
+
         if torch.cuda.is_available():
             gpu_name = torch.cuda.get_device_name(0)
             logger.info(f"CUDA available. GPU: {gpu_name}")
@@ -393,79 +549,87 @@ class LocalPGVectorRAG:
             logger.error(f"Failed to create connection pool: {e}")
             logger.info("Please check your database configuration and ensure PostgreSQL is running.")
             raise
-        
+
+    @contextmanager
+    def _conn(self):
+        """Borrow a pooled connection with pgvector adapters registered.
+
+        The pool rolls back any unfinished transaction on return, so
+        callers only need to commit on success.
+        """
+        conn = self.connection_pool.getconn()
+        register_vector(conn)
+        try:
+            yield conn
+        finally:
+            self.connection_pool.putconn(conn)
+
     def _setup_database(self):
         """Setup database tables and indexes with better error handling"""
-        conn = None
-        cursor = None
         try:
-            conn = self.connection_pool.getconn()
-            register_vector(conn)
-            cursor = conn.cursor()
-            
-            # Enable pgvector extension (may fail if already exists)
-            try:
-                cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-                logger.info("pgvector extension enabled")
-            except Exception as e:
-                logger.warning(f"Could not create vector extension (may already exist): {e}")
-            
-            # Create documents table
-            try:
-                cursor.execute(f"""
-                    CREATE TABLE IF NOT EXISTS financial_documents (
-                        id SERIAL PRIMARY KEY,
-                        content TEXT NOT NULL,
-                        embedding vector({self.embedding_dim}),
-                        pdf_name VARCHAR(255) NOT NULL,
-                        pdf_link TEXT,
-                        year INTEGER,
-                        doc_type VARCHAR(100),
-                        chunk_index INTEGER,
-                        content_hash VARCHAR(64),
-                        ocr_processed BOOLEAN DEFAULT FALSE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        UNIQUE(content_hash)
-                    );
-                """)
-                logger.info("Documents table created/verified")
-            except psycopg2.errors.InsufficientPrivilege as e:
-                logger.error("Insufficient database privileges. Please run the fix_db_permissions.sh script:")
-                logger.error("chmod +x fix_db_permissions.sh && ./fix_db_permissions.sh")
-                raise
-            except Exception as e:
-                logger.error(f"Failed to create documents table: {e}")
-                raise
-            
-            # Create indexes
-            try:
-                cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS financial_documents_embedding_idx 
-                    ON financial_documents USING ivfflat (embedding vector_cosine_ops)
-                    WITH (lists = 100);
-                """)
-                
-                cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS financial_documents_metadata_idx 
-                    ON financial_documents (pdf_name, year, doc_type);
-                """)
-                logger.info("Database indexes created/verified")
-            except Exception as e:
-                logger.warning(f"Could not create indexes (will create later): {e}")
-            
-            conn.commit()
-            logger.info("Database setup completed successfully")
-            
+            with self._conn() as conn:
+                cursor = conn.cursor()
+
+                # Enable pgvector extension (may fail if already exists)
+                try:
+                    cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+                    logger.info("pgvector extension enabled")
+                except Exception as e:
+                    logger.warning(f"Could not create vector extension (may already exist): {e}")
+
+                # Create documents table
+                try:
+                    cursor.execute(f"""
+                        CREATE TABLE IF NOT EXISTS financial_documents (
+                            id SERIAL PRIMARY KEY,
+                            content TEXT NOT NULL,
+                            embedding halfvec({self.embedding_dim}),
+                            pdf_name VARCHAR(255) NOT NULL,
+                            pdf_link TEXT,
+                            year INTEGER,
+                            doc_type VARCHAR(100),
+                            chunk_index INTEGER,
+                            content_hash VARCHAR(64),
+                            ocr_processed BOOLEAN DEFAULT FALSE,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            UNIQUE(content_hash)
+                        );
+                    """)
+                    logger.info("Documents table created/verified")
+                except psycopg2.errors.InsufficientPrivilege as e:
+                    logger.error("Insufficient database privileges. Please run the fix_db_permissions.sh script:")
+                    logger.error("chmod +x fix_db_permissions.sh && ./fix_db_permissions.sh")
+                    raise
+                except Exception as e:
+                    logger.error(f"Failed to create documents table: {e}")
+                    raise
+
+                # Create indexes. FP16 storage halves the bytes the index scan
+                # touches; existing FP32 deployments migrate with:
+                #   ALTER TABLE financial_documents ALTER COLUMN embedding
+                #     TYPE halfvec(<dim>) USING embedding::halfvec(<dim>);
+                try:
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS financial_documents_embedding_idx
+                        ON financial_documents USING hnsw (embedding halfvec_ip_ops)
+                        WITH (m = 16, ef_construction = 64);
+                    """)
+
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS financial_documents_metadata_idx
+                        ON financial_documents (pdf_name, year, doc_type);
+                    """)
+                    logger.info("Database indexes created/verified")
+                except Exception as e:
+                    logger.warning(f"Could not create indexes (will create later): {e}")
+
+                conn.commit()
+                cursor.close()
+                logger.info("Database setup completed successfully")
+
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"Database setup failed: {e}")
             raise
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                self.connection_pool.putconn(conn)
     
     def _extract_text_from_pdf(self, pdf_path: str) -> Tuple[str, bool]:
         """Extract text from PDF file, with OCR fallback"""
@@ -475,29 +639,40 @@ class LocalPGVectorRAG:
             if not os.path.exists(pdf_path):
                 raise FileNotFoundError(f"PDF file not found: {pdf_path}")
                 
-            # First, try regular text extraction
+            # First, try regular text extraction; a single join keeps the
+            # copy cost linear in document size
             doc = fitz.open(pdf_path)
-            text = ""
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text += page.get_text() + "\n"
-            
+            page_texts = [page.get_text() for page in doc]
             doc.close()
-            
+            text = "\n".join(page_texts)
+
             # Check if we got meaningful text
             if text.strip() and len(text.strip()) > 100:
                 logger.info("Successfully extracted text using standard method")
                 return text.strip(), ocr_used
-            
+
             # If no meaningful text, check if it's a scanned PDF
             logger.info("Little/no text found, checking if PDF needs OCR...")
-            
+
             if self.ocr_processor._is_scanned_pdf(pdf_path):
                 logger.info("PDF appears to be scanned, applying OCR...")
-                
+
                 try:
-                    ocr_text = self.ocr_processor.extract_text_with_ocr(pdf_path)
+                    # Only OCR pages without embedded text; pages that
+                    # already carry text keep it, skipping rasterization
+                    # and Tesseract entirely for them
+                    need_ocr = [i for i, t in enumerate(page_texts)
+                                if len(t.strip()) < 50]
+                    if need_ocr and len(need_ocr) < len(page_texts) and OCR_AVAILABLE:
+                        logger.info(f"Selective OCR on {len(need_ocr)}/{len(page_texts)} pages")
+                        merged = list(page_texts)
+                        for page_idx, page_text in zip(
+                                need_ocr,
+                                self.ocr_processor.ocr_page_texts(pdf_path, need_ocr)):
+                            merged[page_idx] = page_text
+                        ocr_text = "\n".join(merged)
+                    else:
+                        ocr_text = self.ocr_processor.extract_text_with_ocr(pdf_path)
                     if ocr_text.strip():
                         logger.info("OCR extraction successful")
                         return ocr_text.strip(), True
@@ -519,35 +694,104 @@ class LocalPGVectorRAG:
         if not text.strip():
             logger.warning("Empty text provided for chunking")
             return []
-            
-        words = text.split()
-        
-        if len(words) <= self.chunk_config.chunk_size:
+
+        # Word (start, end) offsets as one int32 array: chunks slice the
+        # original text directly instead of allocating per-word strings and
+        # re-joining them
+        offsets = np.fromiter(
+            (pos for m in _WS_RE.finditer(text) for pos in (m.start(), m.end())),
+            dtype=np.int32
+        ).reshape(-1, 2)
+        n_words = len(offsets)
+
+        if n_words <= self.chunk_config.chunk_size:
             return [text]
-        
+
         chunks = []
-        overlap_size = int(self.chunk_config.chunk_size * self.chunk_config.overlap_ratio)
-        
-        for i in range(0, len(words), self.chunk_config.chunk_size - overlap_size):
-            chunk_words = words[i:i + self.chunk_config.chunk_size]
-            
-            if len(chunk_words) >= self.chunk_config.min_chunk_size:
-                chunk_text = ' '.join(chunk_words)
-                chunks.append(chunk_text)
-            
-            if i + self.chunk_config.chunk_size >= len(words):
+        chunk_size = self.chunk_config.chunk_size
+        overlap_size = int(chunk_size * self.chunk_config.overlap_ratio)
+
+        for i in range(0, n_words, chunk_size - overlap_size):
+            end = min(i + chunk_size, n_words)
+
+            if end - i >= self.chunk_config.min_chunk_size:
+                chunks.append(text[offsets[i, 0]:offsets[end - 1, 1]])
+
+            if i + chunk_size >= n_words:
                 break
-        
+
         return chunks
     
     def _generate_content_hash(self, content: str) -> str:
         """Generate hash for content deduplication"""
+        if BLAKE3_AVAILABLE:
+            # 32-byte digest keeps the 64-char content_hash column width
+            return blake3.blake3(content.encode("utf-8", "ignore")).hexdigest()
         return hashlib.sha256(content.encode()).hexdigest()
+
+    def _embedding_cache_key(self, text: str) -> bytes:
+        return hashlib.blake2b((self.model_name + text).encode(), digest_size=16).digest()
+
+    def _encode_cached(self, texts):
+        """Encode text(s), serving repeats from the on-disk embedding cache.
+
+        Hits cost a SQLite lookup instead of a transformer forward pass;
+        misses are encoded in one batch and written back as float16 blobs.
+        """
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        keys = [self._embedding_cache_key(text) for text in texts]
+        embeddings: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        # Bulk lookup: one SELECT ... IN per 500 keys instead of a
+        # per-chunk round trip into SQLite (500 stays under the default
+        # host-parameter limit of older SQLite builds)
+        cached = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            cached.update(self._emb_cache_db.execute(
+                f"SELECT key, embedding FROM embedding_cache WHERE key IN ({placeholders})",
+                batch
+            ).fetchall())
+
+        misses = []
+        for i, key in enumerate(keys):
+            blob = cached.get(key)
+            if blob is not None:
+                embeddings[i] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+            else:
+                misses.append(i)
+
+        if misses:
+            # Encode each distinct miss once: filings repeat boilerplate
+            # chunks, and duplicates just scatter from the shared vector
+            by_key: Dict[bytes, List[int]] = {}
+            for i in misses:
+                by_key.setdefault(keys[i], []).append(i)
+
+            encoded = self.embedding_model.encode(
+                [texts[positions[0]] for positions in by_key.values()],
+                batch_size=64, convert_to_numpy=True,
+                normalize_embeddings=True, show_progress_bar=False
+            )
+            self._emb_cache_db.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, embedding) VALUES (?, ?)",
+                [(key, encoded[j].astype(np.float16).tobytes())
+                 for j, key in enumerate(by_key)]
+            )
+            self._emb_cache_db.commit()
+            for j, positions in enumerate(by_key.values()):
+                vector = encoded[j].astype(np.float32)
+                for i in positions:
+                    embeddings[i] = vector
+
+        return embeddings[0] if single else np.vstack(embeddings)
     
     def embed_document(self, pdf_path: str, metadata: DocumentMetadata) -> bool:
         """Process and embed a single document with OCR support"""
-        conn = None
-        cursor = None
         try:
             logger.info(f"Processing document: {pdf_path}")
             
@@ -569,163 +813,259 @@ class LocalPGVectorRAG:
                 
             logger.info(f"Created {len(chunks)} chunks")
             
-            # Process each chunk
-            conn = self.connection_pool.getconn()
-            cursor = conn.cursor()
-            
-            embedded_count = 0
-            for chunk_index, chunk in enumerate(chunks):
-                try:
-                    content_hash = self._generate_content_hash(chunk)
-                    
-                    # Check if chunk already exists
-                    cursor.execute(
-                        "SELECT id FROM financial_documents WHERE content_hash = %s",
-                        (content_hash,)
-                    )
-                    
-                    if cursor.fetchone():
-                        logger.debug(f"Chunk {chunk_index} already exists, skipping")
-                        continue
-                    
-                    # Generate embedding
-                    logger.debug(f"Generating embedding for chunk {chunk_index + 1}/{len(chunks)}")
-                    embedding = self.embedding_model.encode(chunk)
-                    
-                    # Insert into database
-                    cursor.execute("""
-                        INSERT INTO financial_documents 
-                        (content, embedding, pdf_name, pdf_link, year, doc_type, chunk_index, content_hash, ocr_processed)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        chunk,
-                        embedding.tolist(),
-                        metadata.pdf_name,
-                        metadata.pdf_link,
-                        metadata.year,
-                        metadata.doc_type,
-                        chunk_index,
-                        content_hash,
-                        ocr_used
-                    ))
-                    
-                    embedded_count += 1
-                    
-                    # Show progress for large documents
-                    if (chunk_index + 1) % 10 == 0:
-                        logger.info(f"Processed {chunk_index + 1}/{len(chunks)} chunks")
-                        
-                except Exception as e:
-                    logger.error(f"Failed to process chunk {chunk_index}: {e}")
-                    continue
-            
-            conn.commit()
+            embedded_count = self._store_chunks(pdf_path, metadata, chunks, ocr_used)
             logger.info(f"Successfully embedded {embedded_count} new chunks from {pdf_path}")
             return embedded_count > 0
-            
+
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"Document embedding failed for {pdf_path}: {e}")
             return False
-        finally:
-            if cursor:
+
+    def _store_chunks(self, pdf_path: str, metadata: DocumentMetadata,
+                      chunks: List[str], ocr_used: bool) -> int:
+        """Deduplicate, encode and bulk-insert chunks; returns rows written"""
+        # Deduplicate all chunks with one round trip instead of a
+        # SELECT per chunk; the connection goes back to the pool before
+        # the (potentially long) encode phase so other ingest workers
+        # are not starved while embeddings compute
+        hashes = [self._generate_content_hash(chunk) for chunk in chunks]
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT content_hash FROM financial_documents WHERE content_hash = ANY(%s)",
+                (hashes,)
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+
+        new_chunks = [
+            (chunk_index, chunk, content_hash)
+            for chunk_index, (chunk, content_hash) in enumerate(zip(chunks, hashes))
+            if content_hash not in existing
+        ]
+
+        embedded_count = 0
+        if new_chunks:
+            # One batched encode amortizes the per-forward-pass overhead
+            # that encoding chunk-by-chunk pays (unit-normalized so inner
+            # product equals cosine similarity at query time)
+            logger.info(f"Generating embeddings for {len(new_chunks)} new chunks")
+            embeddings = self._encode_cached([chunk for _, chunk, _ in new_chunks])
+            if EMBEDDING_PRECISION == "fp16":
+                embeddings = embeddings.astype(np.float16)
+
+            # HalfVector marshals the ndarray straight through the
+            # registered adapter; .tolist() would materialize 768
+            # Python floats per row just for psycopg2 to re-serialize
+            rows = [
+                (chunk, HalfVector(embedding), metadata.pdf_name, metadata.pdf_link,
+                 metadata.year, metadata.doc_type, chunk_index, content_hash, ocr_used)
+                for (chunk_index, chunk, content_hash), embedding in zip(new_chunks, embeddings)
+            ]
+            # ON CONFLICT makes the insert atomic against concurrent
+            # ingesters racing past the hash preflight above; the
+            # preflight stays so already-stored chunks skip encoding
+            with self._conn() as conn:
+                cursor = conn.cursor()
+                inserted = execute_values(cursor, """
+                    INSERT INTO financial_documents
+                    (content, embedding, pdf_name, pdf_link, year, doc_type, chunk_index, content_hash, ocr_processed)
+                    VALUES %s
+                    ON CONFLICT (content_hash) DO NOTHING
+                    RETURNING 1
+                """, rows, page_size=500, fetch=True)
+                conn.commit()
                 cursor.close()
-            if conn:
-                self.connection_pool.putconn(conn)
+            embedded_count = len(inserted)
+
+        return embedded_count
+
+    def embed_documents(self, pdf_metadata_pairs: List[Tuple[str, DocumentMetadata]],
+                        max_workers: int = 4) -> int:
+        """Ingest multiple PDFs concurrently; returns total chunks written.
+
+        Extraction, OCR and chunking fan out to worker processes (spawned,
+        not forked, to stay CUDA-safe), while the single embedding model in
+        this process encodes each document's new chunks and bulk-inserts
+        them as results arrive.
+        """
+        if not pdf_metadata_pairs:
+            return 0
+
+        jobs = [
+            (pdf_path, self.ocr_processor.config, self.chunk_config)
+            for pdf_path, _ in pdf_metadata_pairs
+        ]
+        embedded_total = 0
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx) as pool:
+            for (pdf_path, metadata), result in zip(
+                    pdf_metadata_pairs, pool.map(_extract_and_chunk_pdf, jobs)):
+                chunks, ocr_used, error = result
+                if error:
+                    logger.error(f"Extraction failed for {pdf_path}: {error}")
+                    continue
+                if not chunks:
+                    logger.warning(f"No chunks produced for {pdf_path}")
+                    continue
+                embedded_total += self._store_chunks(pdf_path, metadata, chunks, ocr_used)
+
+        logger.info(f"Embedded {embedded_total} new chunks from "
+                    f"{len(pdf_metadata_pairs)} documents")
+        return embedded_total
     
-    def search_documents(self, query: str, limit: int = 5, use_hyde: bool = True, 
-                            year_filter: int = None, doc_type_filter: str = None) -> List[Dict[str, Any]]:
-            """Search for relevant documents"""
-            conn = None
-            cursor = None
-            try:
-                # Generate HyDE document if enabled
-                if use_hyde:
-                    search_text = self.hyde_generator.generate_hypothetical_document(query)
-                    logger.info("Using HyDE for enhanced retrieval")
-                else:
-                    search_text = query
-                
-                # Generate query embedding
-                query_embedding = self.embedding_model.encode(search_text)
-                
-                # Build SQL query with optional filters
-                base_query = """
-                    SELECT content, pdf_name, pdf_link, year, doc_type, chunk_index, ocr_processed,
-                           1 - (embedding <=> %s::vector) as similarity
-                    FROM financial_documents
-                """
-                
-                conditions = []
-                params = [query_embedding.tolist()]
-                
-                if year_filter:
-                    conditions.append("year = %s")
-                    params.append(year_filter)
-                
-                if doc_type_filter:
-                    conditions.append("doc_type = %s")
-                    params.append(doc_type_filter)
-                
-                if conditions:
-                    base_query += " WHERE " + " AND ".join(conditions)
-                
-                base_query += " ORDER BY similarity DESC LIMIT %s"
-                params.append(limit)
-                
-                # Execute search
-                conn = self.connection_pool.getconn()
-                cursor = conn.cursor()
-                cursor.execute(base_query, params)
-                
-                results = []
-                for row in cursor.fetchall():
-                    results.append({
-                        'content': row[0],
-                        'pdf_name': row[1],
-                        'pdf_link': row[2],
-                        'year': row[3],
-                        'doc_type': row[4],
-                        'chunk_index': row[5],
-                        'ocr_processed': row[6],
-                        'similarity': float(row[7])
-                    })
-                
+    def _ann_scan(self, query_embedding: np.ndarray, limit: int,
+                  year_filter: int = None, doc_type_filter: str = None,
+                  with_embedding: bool = False) -> List[Any]:
+        """Run one ANN scan over the HNSW index and return the raw rows.
+
+        The query vector ships through the registered HalfVector adapter
+        rather than a ~15 KB text list the server has to re-parse, and rows
+        stream back on a server-side cursor in limit-sized batches.
+        """
+        if EMBEDDING_PRECISION == "fp16":
+            query_embedding = query_embedding.astype(np.float16)
+        query_vector = HalfVector(query_embedding)
+
+        columns = "content, pdf_name, pdf_link, year, doc_type, chunk_index, ocr_processed"
+        if with_embedding:
+            columns += ", embedding"
+
+        base_query = f"""
+            SELECT {columns},
+                   -(embedding <#> %s) as similarity
+            FROM financial_documents
+        """
+
+        conditions = []
+        params = [query_vector]
+
+        if year_filter:
+            conditions.append("year = %s")
+            params.append(year_filter)
+
+        if doc_type_filter:
+            conditions.append("doc_type = %s")
+            params.append(doc_type_filter)
+
+        if conditions:
+            base_query += " WHERE " + " AND ".join(conditions)
+
+        # Order by the raw operator so the halfvec_ip_ops index is usable
+        base_query += " ORDER BY embedding <#> %s LIMIT %s"
+        params.extend([query_vector, limit])
+
+        with self._conn() as conn:
+            setup_cursor = conn.cursor()
+            setup_cursor.execute("SET hnsw.ef_search = 40")
+            setup_cursor.close()
+
+            cursor = conn.cursor(name='search_documents',
+                                 cursor_factory=NamedTupleCursor)
+            cursor.itersize = limit
+            cursor.execute(base_query, params)
+            rows = list(cursor)
+            cursor.close()
+            conn.commit()
+
+        return rows
+
+    @staticmethod
+    def _row_to_result(row, similarity: float) -> Dict[str, Any]:
+        return {
+            'content': row.content,
+            'pdf_name': row.pdf_name,
+            'pdf_link': row.pdf_link,
+            'year': row.year,
+            'doc_type': row.doc_type,
+            'chunk_index': row.chunk_index,
+            'ocr_processed': row.ocr_processed,
+            'similarity': similarity
+        }
+
+    def search_documents(self, query: str, limit: int = 5, use_hyde: bool = True,
+                         year_filter: int = None, doc_type_filter: str = None) -> List[Dict[str, Any]]:
+        """Search for relevant documents.
+
+        With HyDE enabled the LLM round trip is overlapped with a
+        speculative ANN scan on the raw-query embedding: the scan pulls a
+        wider candidate pool (with stored vectors) while the hypothetical
+        document generates, then candidates are re-scored client-side
+        against the HyDE embedding. Total latency is max(LLM, scan)
+        instead of LLM + scan, and the second embedding never touches
+        the database.
+        """
+        try:
+            if not use_hyde:
+                rows = self._ann_scan(self._encode_cached(query), limit,
+                                      year_filter, doc_type_filter)
+                results = [self._row_to_result(row, float(row.similarity)) for row in rows]
                 logger.info(f"Found {len(results)} relevant documents")
                 return results
-                
+
+            # Kick off HyDE generation, then scan speculatively with the
+            # raw query while the LLM call is in flight
+            hyde_future = self._hyde_executor.submit(
+                self.hyde_generator.generate_hypothetical_document, query)
+            logger.info("Using HyDE for enhanced retrieval")
+
+            # Query embedding is unit-normalized; stored vectors are
+            # normalized too, so <#> inner product == cosine
+            query_embedding = self._encode_cached(query)
+            candidates = self._ann_scan(query_embedding, limit * 4,
+                                        year_filter, doc_type_filter,
+                                        with_embedding=True)
+
+            try:
+                hyde_text = hyde_future.result(timeout=60)
             except Exception as e:
-                logger.error(f"Document search failed: {e}")
-                return []
-            finally:
-                if cursor:
-                    cursor.close()
-                if conn:
-                    self.connection_pool.putconn(conn)
+                logger.warning(f"HyDE generation failed, using raw query ranking: {e}")
+                hyde_text = query
+
+            if hyde_text != query and candidates:
+                # Re-rank the candidate pool against the HyDE embedding:
+                # a dot product over ~4*limit vectors, no second SQL trip
+                hyde_embedding = self._encode_cached(hyde_text).astype(np.float32)
+                candidate_vectors = np.array(
+                    [row.embedding.to_numpy() for row in candidates], dtype=np.float32)
+                similarities = candidate_vectors @ hyde_embedding
+                # argpartition is O(N) vs O(N log N) for a full sort; only
+                # the winning limit entries need ordering
+                top = np.argpartition(-similarities, min(limit, len(similarities) - 1))[:limit]
+                order = top[np.argsort(-similarities[top])]
+                results = [self._row_to_result(candidates[i], float(similarities[i]))
+                           for i in order]
+            else:
+                results = [self._row_to_result(row, float(row.similarity))
+                           for row in candidates[:limit]]
+
+            logger.info(f"Found {len(results)} relevant documents")
+            return results
+
+        except Exception as e:
+            logger.error(f"Document search failed: {e}")
+            return []
 
     
     def get_document_stats(self) -> Dict[str, Any]:
         """Get statistics about indexed documents"""
-        conn = None
-        cursor = None
         try:
-            conn = self.connection_pool.getconn()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_chunks,
-                    COUNT(DISTINCT pdf_name) as unique_documents,
-                    COUNT(DISTINCT year) as unique_years,
-                    COUNT(DISTINCT doc_type) as unique_doc_types,
-                    COUNT(CASE WHEN ocr_processed = true THEN 1 END) as ocr_processed_chunks,
-                    MIN(year) as earliest_year,
-                    MAX(year) as latest_year
-                FROM financial_documents
-            """)
-            
-            row = cursor.fetchone()
+            with self._conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT
+                        COUNT(*) as total_chunks,
+                        COUNT(DISTINCT pdf_name) as unique_documents,
+                        COUNT(DISTINCT year) as unique_years,
+                        COUNT(DISTINCT doc_type) as unique_doc_types,
+                        COUNT(CASE WHEN ocr_processed = true THEN 1 END) as ocr_processed_chunks,
+                        MIN(year) as earliest_year,
+                        MAX(year) as latest_year
+                    FROM financial_documents
+                """)
+                row = cursor.fetchone()
+                cursor.close()
+
             if row:
                 return {
                     'total_chunks': row[0],
@@ -746,15 +1086,29 @@ class LocalPGVectorRAG:
                     'earliest_year': None,
                     'latest_year': None
                 }
-            
+
         except Exception as e:
             logger.error(f"Stats retrieval failed: {e}")
             return {}
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                self.connection_pool.putconn(conn)
+
+def _extract_and_chunk_pdf(args):
+    """Extract, OCR and chunk one PDF in a worker process.
+
+    Builds a bare LocalPGVectorRAG shell carrying only the OCR processor
+    and chunk config, so workers never load the embedding model or open
+    database connections. Returns (chunks, ocr_used, error).
+    """
+    pdf_path, ocr_config, chunk_config = args
+    try:
+        shell = LocalPGVectorRAG.__new__(LocalPGVectorRAG)
+        shell.ocr_processor = OCRProcessor(ocr_config)
+        shell.chunk_config = chunk_config
+        text, ocr_used = shell._extract_text_from_pdf(pdf_path)
+        chunks = shell._chunk_text(text) if text else []
+        return chunks, ocr_used, None
+    except Exception as e:
+        return [], False, str(e)
+
 
 def main():
     """Main function for testing the RAG system"""
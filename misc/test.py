@@ -14,6 +14,7 @@ from typing import List, Dict, Any, Optional
 from dataclasses import field
 from pydantic import BaseModel, Field
 from openai import OpenAI
+import httpx
 
 # ==========================================
 # Configuration
@@ -23,8 +24,24 @@ API_KEY = "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
 BASE_URL = "https://integrate.api.nvidia.com/v1"
 MODEL = "nvidia/llama-3.3-nemotron-super-49b-v1.5"
 
-# Initialize OpenAI-compatible client
-client = OpenAI(base_url=BASE_URL, api_key=API_KEY)
+# Initialize OpenAI-compatible client. The explicit httpx client enables
+# HTTP/2 so all examples multiplex one kept-alive connection instead of
+# paying a TCP+TLS handshake per call; without the optional h2 package
+# the client falls back to HTTP/1.1 keep-alive.
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+client = OpenAI(
+    base_url=BASE_URL,
+    api_key=API_KEY,
+    http_client=httpx.Client(
+        http2=_HTTP2,
+        limits=httpx.Limits(max_keepalive_connections=16),
+    ),
+)
 
 
 # ==========================================
@@ -64,7 +81,7 @@ def example_1_simple_plan():
     print("EXAMPLE 1: Simple Financial Plan with guided_json")
     print("="*60)
     
-    schema = FinancialPlan.model_json_schema()
+    schema = _SCHEMAS[FinancialPlan]
     
     completion = client.chat.completions.create(
         model=MODEL,
@@ -82,9 +99,8 @@ def example_1_simple_plan():
     response_text = completion.choices[0].message.content
     print(f"\nRaw LLM Response:\n{response_text}\n")
     
-    # Parse the guaranteed JSON
-    plan_data = json.loads(response_text)
-    plan = FinancialPlan(**plan_data)
+    # Parse the guaranteed JSON in one pass inside pydantic-core
+    plan = FinancialPlan.model_validate_json(response_text)
     
     print(f"\nParsed Plan:")
     print(f"  Goal: {plan.goal}")
@@ -145,7 +161,7 @@ def example_2_investment_analysis():
     print("EXAMPLE 2: Investment Portfolio Analysis with guided_json")
     print("="*60)
     
-    schema = InvestmentPortfolio.model_json_schema()
+    schema = _SCHEMAS[InvestmentPortfolio]
     
     completion = client.chat.completions.create(
         model=MODEL,
@@ -164,9 +180,8 @@ def example_2_investment_analysis():
     response_text = completion.choices[0].message.content
     print(f"\nRaw LLM Response:\n{response_text}\n")
     
-    # Parse the guaranteed JSON
-    portfolio_data = json.loads(response_text)
-    portfolio = InvestmentPortfolio(**portfolio_data)
+    # Parse the guaranteed JSON in one pass inside pydantic-core
+    portfolio = InvestmentPortfolio.model_validate_json(response_text)
     
     print(f"\nParsed Portfolio:")
     print(f"  Strategy: {portfolio.portfolio_name}")
@@ -223,7 +238,7 @@ def example_3_budget_planning():
     print("EXAMPLE 3: Monthly Budget Planning with guided_json")
     print("="*60)
     
-    schema = BudgetPlan.model_json_schema()
+    schema = _SCHEMAS[BudgetPlan]
     
     completion = client.chat.completions.create(
         model=MODEL,
@@ -241,9 +256,8 @@ def example_3_budget_planning():
     response_text = completion.choices[0].message.content
     print(f"\nRaw LLM Response:\n{response_text}\n")
     
-    # Parse the guaranteed JSON
-    budget_data = json.loads(response_text)
-    budget = BudgetPlan(**budget_data)
+    # Parse the guaranteed JSON in one pass inside pydantic-core
+    budget = BudgetPlan.model_validate_json(response_text)
     
     print(f"\nParsed Budget Plan:")
     print(f"  Total Monthly Income: ${budget.total_monthly_income:.2f}")
@@ -278,6 +292,14 @@ class Plan(BaseModel):
     steps: List[PlanStep] = Field(description="Ordered list of steps to execute")
 
 
+# Schema generation walks the whole model graph; build each schema once at
+# import instead of on every example call.
+_SCHEMAS = {
+    cls: cls.model_json_schema()
+    for cls in (FinancialPlan, InvestmentPortfolio, BudgetPlan, Plan)
+}
+
+
 def example_4_finai_planner():
     """Generate a FinAI planner output using guided_json."""
     print("\n" + "="*60)
@@ -291,7 +313,7 @@ def example_4_finai_planner():
         "general_advisor": {"advise": "Provide general financial advice"},
     }
     
-    schema = Plan.model_json_schema()
+    schema = _SCHEMAS[Plan]
     
     system_prompt = f"""You are the FinAI Planner. Decompose a user's financial query into a minimal,
 reliable plan. Available agents: {list_of_agents}
@@ -314,9 +336,8 @@ Choose the *single best* agent when in doubt. Only include steps that move the g
     response_text = completion.choices[0].message.content
     print(f"\nRaw LLM Response:\n{response_text}\n")
     
-    # Parse the guaranteed JSON
-    plan_data = json.loads(response_text)
-    plan = Plan(**plan_data)
+    # Parse the guaranteed JSON in one pass inside pydantic-core
+    plan = Plan.model_validate_json(response_text)
     
     print(f"\nParsed Plan:")
     print(f"  Goal: {plan.goal}")
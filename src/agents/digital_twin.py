@@ -3,14 +3,23 @@
 # ==============================================
 from __future__ import annotations
 from typing import Dict, Any
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class DigitalTwin:
     def run(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        print("[DEBUG from digital_twin.py]: Running DigitalTwin agent")
+        logger.debug("Running DigitalTwin agent")
         profile = state.get("profile", {})
         tx = state.get("transactions", [])
-        spend = sum(t.get("amount", 0) for t in tx if t.get("type") == "expense")
+        tx_soa = state.get("tx_soa")
+        if tx_soa is not None:
+            # Vectorized mask+sum over the orchestrator-built SoA arrays
+            amounts, types = tx_soa
+            spend = float(amounts[types == "expense"].sum())
+        else:
+            spend = sum(t.get("amount", 0) for t in tx if t.get("type") == "expense")
         return "This is a placeholder response from Digital Twin agent."
         # return {
         #     "summary": f"Hello from Digital Twin {profile.get('name', 'user')}, your recent expenses total {spend}.",
@@ -19,3 +28,8 @@ class DigitalTwin:
         #         "Automate 10% income to investments",
         #     ],
         # }
+
+    def run_batch(self, states: list) -> list:
+        # Default batch hook: agents that can amortize work across calls
+        # (shared API round trips, one model prompt) override this
+        return [self.run(state) for state in states]
@@ -1,17 +1,23 @@
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
+from collections import OrderedDict
+import orjson
 import re
+import time
 import uvicorn
 #from core import general_advisor
 import os
 from openai import OpenAI
 #from core.finai_core import finai_agent
 from .core.orchestrator import Orchestrator
+from .tools.data_loader import DATA_DIR, TTL_SECONDS
 from dotenv import load_dotenv
 
 load_dotenv(".env")
 
-app = FastAPI(title="FinAI MCP API", version="1.0.0")
+app = FastAPI(title="FinAI MCP API", version="1.0.0",
+              default_response_class=ORJSONResponse)
 
 # ---------------------------
 # MCP Registry Definition
@@ -42,6 +48,22 @@ registry = {
     }
 }
 
+# Union the routing rules into one alternation compiled at import: a single
+# scan of the query replaces one re.search per rule. Rule order is still the
+# priority order, so /route keeps one finditer pass and picks the
+# highest-priority group seen (a plain search would let a low-priority rule
+# matching earlier in the string win).
+_MEGA_RULE = re.compile(
+    "|".join(
+        f"(?P<{rule['route']}>{rule['pattern']})"
+        for rule in registry["routing"]["rules"]
+    ),
+    re.IGNORECASE,
+)
+_RULE_PRIORITY = {
+    rule["route"]: i for i, rule in enumerate(registry["routing"]["rules"])
+}
+
 
 # ---------------------------
 # Models
@@ -56,18 +78,29 @@ class AgentRequest(BaseModel):
 # API Endpoints
 # ---------------------------
 
+# The registry never changes after import; serialize it once instead of
+# re-encoding the same dict on every request
+_REGISTRY_BYTES = orjson.dumps(registry)
+
+
 @app.get("/registry")
 def get_registry():
     """Return MCP registry JSON"""
-    return registry
+    return Response(_REGISTRY_BYTES, media_type="application/json")
 
 
 @app.get("/route")
 def route_query(query: str = Query(..., description="User query")):
     """Route query to the correct agent"""
-    for rule in registry["routing"]["rules"]:
-        if re.search(rule["pattern"], query, re.IGNORECASE):
-            return {"query": query, "agent": rule["route"]}
+    best = None
+    for match in _MEGA_RULE.finditer(query):
+        priority = _RULE_PRIORITY[match.lastgroup]
+        if best is None or priority < best:
+            best = priority
+            if best == 0:
+                break
+    if best is not None:
+        return {"query": query, "agent": registry["routing"]["rules"][best]["route"]}
     return {"query": query, "agent": registry["routing"]["fallback"]}
 
 
@@ -90,15 +123,48 @@ def run_agent(agent_name: str, request: AgentRequest):
     }
 
 
+# Memoize orchestration results per (user, normalized query): a repeated
+# query skips the full planner/router/agent LLM round trips entirely.
+# Entries carry the same TTL + data-file mtime check as the data_loader
+# caches, so a cached answer never outlives the data it was computed from.
+_PLAN_CACHE_SIZE = 10_000
+_plan_cache: OrderedDict = OrderedDict()
+
+
+def _data_mtimes():
+    mtimes = []
+    for name in ("dummy_user.json", "dummy_transactions.csv"):
+        try:
+            mtimes.append((DATA_DIR / name).stat().st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
 @app.post("/query")
 def query_entry(request: AgentRequest):
     print("[DEBUG from app.py]: Called Core Orchestrator")
+    user_id = request.profile.get("user_id")
+    cache_key = (user_id, " ".join(request.query.lower().split()))
+    mtimes = _data_mtimes()
+
+    entry = _plan_cache.get(cache_key)
+    if entry is not None:
+        cached_at, cached_mtimes, cached = entry
+        if time.monotonic() - cached_at < TTL_SECONDS and cached_mtimes == mtimes:
+            _plan_cache.move_to_end(cache_key)
+            return cached
+
     orch = Orchestrator()
     final = orch.run(
-        user_id=request.profile.get("user_id"),# if request.profile else "anonymous",
+        user_id=user_id,# if request.profile else "anonymous",
         query=request.query,
     )
     print("[DEBUG from app.py]: Final result from Orchestrator:")
+
+    _plan_cache[cache_key] = (time.monotonic(), mtimes, final)
+    if len(_plan_cache) > _PLAN_CACHE_SIZE:
+        _plan_cache.popitem(last=False)
     return final
 
 @app.post("/chat")
@@ -3,20 +3,39 @@
 # File: src/core/orchestrator.py (UPDATED to integrate Crew path)
 # ==============================================
 from __future__ import annotations
-from typing import TypedDict, List, Dict, Any, Optional
+from typing import TypedDict, List, Dict, Any, Optional, Tuple, Annotated, Deque
 from dataclasses import dataclass
+from collections import deque
+import asyncio
+import functools
+import operator
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from langgraph.graph import StateGraph, START, END
-from src.tools.llm_client import LLMClient
+from langgraph.types import Send
+import logging
+from src.tools.llm_client import LLMClient, background_loop
+
+logger = logging.getLogger(__name__)
+
 try:
-    from src.tools.data_loader import load_user_profile, load_user_transactions
+    from src.tools.data_loader import (
+        load_user_profile, load_user_transactions, load_user_transactions_soa
+    )
 except:
-    print("[DEBUG from orchestrator.py]: Data loader not available, using stubs")
+    logger.warning("Data loader not available, using stubs")
     def load_user_profile(user_id: str) -> Dict[str, Any]:
         return {"user_id": user_id, "name": "Demo User", "risk_profile": "moderate"}
     def load_user_transactions(user_id: str) -> List[Dict[str, Any]]:
         return [{"tx_id": "t1", "amount": 2500, "type": "expense", "category": "groceries"}]
+    def load_user_transactions_soa(user_id: str) -> Dict[str, Any]:
+        tx = load_user_transactions(user_id)
+        return {
+            "amount": np.asarray([t["amount"] for t in tx], dtype=np.float32),
+            "type": np.asarray([t["type"] for t in tx]),
+        }
 
-from src.core.planner import PlannerAgent, Plan
+from src.core.planner import PlannerAgent, Plan, PlanStep
 from src.core.router import RouterAgent
 
 # Import minimal agents for registry & resolution
@@ -25,18 +44,29 @@ from src.agents.__all_minimal__ import (
 )
 
 
+_REGISTRY = {
+    "upstox": Upstox,
+    "digital_twin_persona": DigitalTwin,
+    "deep_web_research": DeepWebResearch,
+    "us_stock_analysis": USStock,
+    "indian_stock_analysis": IndianStock,
+    "general_advisor": Advisor,
+}
+
+
+# One process-wide prefetch pool: the loads it runs are tiny and cached,
+# and app.py constructs an Orchestrator per request, so a per-instance
+# pool would spawn threads every request that only die at GC
+_PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=3)
+
+
+@functools.lru_cache(maxsize=None)
 def _resolve_agent(agent_key: str):
-    registry = {
-        "upstox": Upstox,
-        "digital_twin_persona": DigitalTwin,
-        "deep_web_research": DeepWebResearch,
-        "us_stock_analysis": USStock,
-        "indian_stock_analysis": IndianStock,
-        "general_advisor": Advisor,
-    }
-    if agent_key not in registry:
+    # Agents keep no per-call state in run(), so one instance per key
+    # serves the whole process instead of a fresh construction per step
+    if agent_key not in _REGISTRY:
         raise KeyError(f"Unknown agent key: {agent_key}")
-    return registry[agent_key]()
+    return _REGISTRY[agent_key]()
 
 
 class GraphState(TypedDict, total=False):
@@ -44,13 +74,28 @@ class GraphState(TypedDict, total=False):
     query: str
     hinted_agent: Optional[str]
     intent: Optional[str]
+    # Futures submitted in arun() so profile/transaction loading overlaps
+    # the planner's LLM call
+    profile_future: Any
+    tx_future: Any
+    tx_soa_future: Any
     plan: Plan
-    step_index: int
+    # Pop-front queue of steps yet to run; the conditional edges test its
+    # front instead of re-indexing plan.steps on every transition
+    remaining_steps: Deque[PlanStep]
     profile: Dict[str, Any]
     transactions: List[Dict[str, Any]]
+    tx_soa: Tuple[np.ndarray, np.ndarray]
     selected_agent: Optional[str]
-    scratchpad: List[Dict[str, Any]]
+    # Reducer-merged: nodes return just their scratchpad delta and the
+    # runtime concatenates, so no node copies or mutates the shared list
+    scratchpad: Annotated[List[Dict[str, Any]], operator.add]
     result: Dict[str, Any]
+    # Fan-out fields: `steps` is a per-branch payload of a Send dispatch
+    # (all steps for one agent); `results` merges parallel branch outputs
+    # via the list reducer
+    steps: List[PlanStep]
+    results: Annotated[List[Dict[str, Any]], operator.add]
     error: Optional[str]
     #mode: Optional[str] # [ main / agent ] (individual agent might need to use planner again)
 
@@ -61,14 +106,33 @@ class OrchestratorConfig:
 
 
 class Orchestrator:
-    def __init__(self, config: Optional[OrchestratorConfig] = None, llm_client=LLMClient()):
-        print("[DEBUG from orchestrator.py]: Initialized Core Orchestrator")
+    # Compiled graph shared across default-constructed instances, keyed by
+    # max_steps: compile() validates channels and builds the Pregel plan,
+    # which is identical for identically-configured orchestrators. The
+    # cached graph's nodes stay bound to the instance that first compiled
+    # it - interchangeable only when every instance uses the singleton
+    # LLMClient - so passing a custom llm_client bypasses the cache and
+    # compiles a graph bound to this instance's own planner.
+    _graph_cache: Dict[int, Any] = {}
+
+    def __init__(self, config: Optional[OrchestratorConfig] = None,
+                 llm_client: Optional[LLMClient] = None):
+        logger.debug("Initialized Core Orchestrator")
         self.config = config or OrchestratorConfig()
-        self.planner = PlannerAgent(llm_client)
+        self.planner = PlannerAgent(llm_client or LLMClient.get_default())
         self.router = RouterAgent()
-        self.graph = self._build_graph()
+        # Prefetch pool: data loads run here while the planner awaits NIM
+        self._prefetch_executor = _PREFETCH_EXECUTOR
+        if llm_client is None:
+            graph = self._graph_cache.get(self.config.max_steps)
+            if graph is None:
+                graph = self._build_graph()
+                self._graph_cache[self.config.max_steps] = graph
+            self.graph = graph
+        else:
+            self.graph = self._build_graph()
 
-    def _node_plan(self, state: GraphState) -> GraphState:
+    async def _node_plan(self, state: GraphState) -> GraphState:
         '''
         START node
         Passes GraphState with 'query' and optional 'intent' to PlannerAgent.
@@ -87,40 +151,55 @@ class Orchestrator:
                 ), PlanStep(id=2, ...), ... ]
         )
         '''
-        print("[DEBUG from orchestrator.py]: Planning step")
-        plan = self.planner.plan(goal=state["query"], intent=state.get("intent"))
-        new: GraphState = dict(state)
-        new["plan"] = plan
-        new["step_index"] = 0
-        new.setdefault("scratchpad", []).append({"event": "planned", "steps": len(plan.steps)})
-        return new
+        logger.debug("Planning step")
+        plan = await self.planner.aplan(goal=state["query"], intent=state.get("intent"))
+        return {
+            "plan": plan,
+            "remaining_steps": deque(plan.steps),
+            "scratchpad": [{"event": "planned", "steps": len(plan.steps)}],
+        }
 
     def _node_prepare_data(self, state: GraphState) -> GraphState:
-        print("[DEBUG from orchestrator.py]: Preparing user data")
+        logger.debug("Preparing user data")
         uid = state["user_id"]
-        profile = load_user_profile(uid)
-        print(f"[DEBUG from orchestrator.py]: Loaded profile for user_id={uid}")
-        tx = load_user_transactions(uid)
-        new = dict(state)
-        new["profile"], new["transactions"] = profile, tx
-        new.setdefault("scratchpad", []).append({"event": "data_loaded", "tx_count": len(tx)})
-        #print(new)
-        return new
+        profile_future = state.get("profile_future")
+        tx_future = state.get("tx_future")
+        tx_soa_future = state.get("tx_soa_future")
+        if profile_future is not None and tx_future is not None:
+            # Prefetched in arun() concurrently with the planner LLM call,
+            # so by now the loads have typically already finished
+            profile = profile_future.result()
+            tx = tx_future.result()
+            soa = tx_soa_future.result() if tx_soa_future is not None \
+                else load_user_transactions_soa(uid)
+        else:
+            profile = load_user_profile(uid)
+            tx = load_user_transactions(uid)
+            soa = load_user_transactions_soa(uid)
+        logger.debug("Loaded profile for user_id=%s", uid)
+        return {
+            "profile": profile,
+            "transactions": tx,
+            # Columnar view shared from the loader's cache, so agents
+            # mask+sum in C and the arrays are built once per file version
+            # instead of once per request
+            "tx_soa": (soa["amount"], soa["type"]),
+            "scratchpad": [{"event": "data_loaded", "tx_count": len(tx)}],
+        }
 
     def _node_route(self, state: GraphState) -> GraphState:
-        print("[DEBUG from orchestrator.py]: Routing to agent")
+        logger.debug("Routing to agent")
         hinted = state.get("fin_advisor")
-        step = state["plan"].steps[state["step_index"]]
+        step = state["remaining_steps"][0]
         agent_key = step.agent if step.agent != "router" else self.router.route(state["query"], hinted)
-        new = dict(state)
-        new["selected_agent"] = agent_key
-        print(f"[DEBUG from orchestrator.py]: Routed to agent '{agent_key}'")
-        new.setdefault("scratchpad", []).append({"event": "routed", "agent": agent_key})
-        print("Printing the state from router",new)
-        return new
+        logger.debug("Routed to agent '%s'", agent_key)
+        return {
+            "selected_agent": agent_key,
+            "scratchpad": [{"event": "routed", "agent": agent_key}],
+        }
 
     def _node_execute(self, state: GraphState) -> GraphState:
-        print("[DEBUG from orchestrator.py]: Executing agent")
+        logger.debug("Executing agent")
         agent_key = state.get("selected_agent")
         if not agent_key:
             raise RuntimeError("No agent selected to execute.")
@@ -147,46 +226,119 @@ class Orchestrator:
         #         "transactions": state.get("transactions"),
         #     })
 
-        print(f"[DEBUG from orchestrator.py]: Resolving and running agent '{agent_key}'")
+        logger.debug("Resolving and running agent '%s'", agent_key)
         agent = _resolve_agent(agent_key)
         payload = agent.run({
             "query": state["query"],
             "profile": state.get("profile"),
             "transactions": state.get("transactions"),
+            "tx_soa": state.get("tx_soa"),
         })
 
-        new = dict(state)
-        new.setdefault("scratchpad", []).append({"event": "executed", "agent": agent_key})
-        new["result"] = payload
-        return new
+        return {
+            "result": payload,
+            "scratchpad": [{"event": "executed", "agent": agent_key}],
+        }
+
+    def _node_dispatch(self, state: GraphState) -> GraphState:
+        '''
+        Junction node for the fan-out decision; the conditional edge on it
+        does the actual dispatch.
+        '''
+        return {}
+
+    def _dispatch_steps(self, state: GraphState):
+        '''
+        Fan independent plan steps out to parallel execute_one branches.
+
+        Steps are treated as independent when none carries inputs (inputs
+        may reference a prior step's output); anything else falls back to
+        the sequential route -> execute loop.
+        '''
+        plan = state["plan"]
+        runnable = [s for s in plan.steps if s.agent != "router"]
+        if len(runnable) > 1 and all(not s.inputs for s in runnable):
+            # One branch per agent, not per step: an agent hit by several
+            # steps gets them as one run_batch call, amortizing whatever
+            # per-call setup the agent does
+            by_agent: Dict[str, List[PlanStep]] = {}
+            for step in runnable:
+                by_agent.setdefault(step.agent, []).append(step)
+            logger.debug("Fanning out %d independent steps across %d agents",
+                         len(runnable), len(by_agent))
+            base = {
+                "query": state["query"],
+                "hinted_agent": state.get("hinted_agent"),
+                "profile": state.get("profile"),
+                "transactions": state.get("transactions"),
+                "tx_soa": state.get("tx_soa"),
+            }
+            return [Send("execute_one", {**base, "steps": steps})
+                    for steps in by_agent.values()]
+        return "route"
+
+    def _node_execute_one(self, state: GraphState) -> GraphState:
+        '''
+        Run one agent's batch of plan steps; parallel branches merge
+        through the `results` reducer.
+        '''
+        steps = state["steps"]
+        agent_key = steps[0].agent
+        logger.debug("Executing %d step(s) on agent '%s'", len(steps), agent_key)
+        agent = _resolve_agent(agent_key)
+        inputs = [{
+            "query": state["query"],
+            "profile": state.get("profile"),
+            "transactions": state.get("transactions"),
+            "tx_soa": state.get("tx_soa"),
+            "inputs": step.inputs,
+        } for step in steps]
+        payloads = agent.run_batch(inputs)
+        return {"results": [{"agent": agent_key, "output": payload} for payload in payloads]}
+
+    def _node_aggregate(self, state: GraphState) -> GraphState:
+        '''
+        Collect the fan-out branch results into the final `result` field.
+        '''
+        logger.debug("Aggregating fan-out results")
+        results = state.get("results", [])
+        return {
+            "result": {r["agent"]: r["output"] for r in results},
+            "selected_agent": results[-1]["agent"] if results else None,
+            "scratchpad": [{"event": "aggregated", "count": len(results)}],
+        }
 
     def _node_next_step(self, state: GraphState) -> GraphState:
         '''
-        Move to next step in the plan and increment step_index.
+        Consume the finished step off the front of the queue.
         '''
-        print("[DEBUG from orchestrator.py]: Moving to next step")
-        new = dict(state)
-        new["step_index"] = state.get("step_index", 0) + 1
-        return new
+        logger.debug("Moving to next step")
+        remaining = state["remaining_steps"]
+        remaining.popleft()
+        return {"remaining_steps": remaining}
+
+    def _entry(self, state: GraphState) -> str:
+        # arun() seeds a one-step plan when the router's regex already
+        # resolved the query; in that case the planner LLM call is pure
+        # overhead and the graph starts at data preparation instead
+        return "prepare_data" if state.get("plan") else "planner"
 
     def _should_prepare_data(self, state: GraphState) -> str:
-        print("[DEBUG from orchestrator.py]: Checking if data preparation is needed")
+        logger.debug("Checking if data preparation is needed")
         if not state.get("profile") or not state.get("transactions"):
             return "prepare_data"
-        return "route"
+        return "dispatch"
 
     def _should_continue(self, state: GraphState) -> str:
-        print("[DEBUG from orchestrator.py]: Checking if should continue to next step")
-        step_idx = state.get("step_index", 0)
-        
-        total = len(state["plan"].steps)
-        if step_idx >= total or step_idx >= self.config.max_steps:
-            print("[DEBUG from orchestrator.py]: Reached max steps or end of plan, ending orchestration")
+        logger.debug("Checking if should continue to next step")
+        remaining = state["remaining_steps"]
+        done = len(state["plan"].steps) - len(remaining)
+        if not remaining or done >= self.config.max_steps:
+            logger.debug("Reached max steps or end of plan, ending orchestration")
             return "end"
-        next_step_agent = state["plan"].steps[step_idx].agent
-        if next_step_agent == "router":
+        if remaining[0].agent == "router":
             # if it is a routing step, END
-            print("[DEBUG from orchestrator.py]: Next step is routing, ending orchestration")
+            logger.debug("Next step is routing, ending orchestration")
             return "end"
         # print(state.get("plan"))
         return "execute"
@@ -195,16 +347,27 @@ class Orchestrator:
         g = StateGraph(GraphState)
         g.add_node("planner", self._node_plan)
         g.add_node("prepare_data", self._node_prepare_data)
+        g.add_node("dispatch", self._node_dispatch)
         g.add_node("route", self._node_route)
         g.add_node("execute", self._node_execute)
+        g.add_node("execute_one", self._node_execute_one)
+        g.add_node("aggregate", self._node_aggregate)
         g.add_node("next", self._node_next_step)
 
-        g.add_edge(START, "planner")
+        g.add_conditional_edges(START, self._entry, {
+            "planner": "planner",
+            "prepare_data": "prepare_data",
+        })
         g.add_conditional_edges("planner", self._should_prepare_data, {
             "prepare_data": "prepare_data",
-            "route": "route",
+            "dispatch": "dispatch",
         })
-        g.add_edge("prepare_data", "route")
+        g.add_edge("prepare_data", "dispatch")
+        # Independent steps fan out to execute_one (Send); dependent plans
+        # take the original sequential loop
+        g.add_conditional_edges("dispatch", self._dispatch_steps, ["execute_one", "route"])
+        g.add_edge("execute_one", "aggregate")
+        g.add_edge("aggregate", END)
         g.add_conditional_edges("route", self._should_continue, {
             "execute": "execute",
             "route": "route",
@@ -218,19 +381,59 @@ class Orchestrator:
         })
         return g.compile()
 
-    def run(self, user_id: str, query: str, hinted_agent: Optional[str] = None) -> Dict[str, Any]:
+    async def arun(self, user_id: str, query: str, hinted_agent: Optional[str] = None) -> Dict[str, Any]:
         '''
-        takes user_id, query, optional hinted_agent as input
-        returns final orchestration result with answer, trace, selected_agent, steps
+        Async entrypoint: ainvoke lets the planner's awaited LLM call and
+        the Send fan-out branches overlap on one event loop.
         '''
-        print("[DEBUG from orchestrator.py]: Running orchestration graph")
+        logger.debug("Running orchestration graph")
         state: GraphState = {"user_id": user_id, "query": query, "hinted_agent": hinted_agent}
-        
+
+        # Short-circuit: when the router's regex pass (or an explicit hint)
+        # already names an executable agent, a one-step plan is all the
+        # planner would produce - skip its LLM round trip entirely. Intent
+        # keys outside _REGISTRY still go through the planner, which maps
+        # them onto the agents that actually exist.
+        fast_agent = self.router.route_fast(query, hinted_agent)
+        if fast_agent in _REGISTRY:
+            logger.debug("Direct-routing to '%s', skipping planner", fast_agent)
+            state["plan"] = Plan(
+                goal=query,
+                rationale="direct-route",
+                steps=[PlanStep(
+                    id=1,
+                    description="Route and answer.",
+                    agent=fast_agent,
+                    inputs={},
+                    success_criteria="Matched agent answers the query.",
+                )],
+            )
+            state["remaining_steps"] = deque(state["plan"].steps)
+
+        # Kick data loading off now so it overlaps the planner's LLM call
+        # instead of running after it on the critical path
+        state["profile_future"] = self._prefetch_executor.submit(load_user_profile, user_id)
+        state["tx_future"] = self._prefetch_executor.submit(load_user_transactions, user_id)
+        state["tx_soa_future"] = self._prefetch_executor.submit(load_user_transactions_soa, user_id)
+
         #invoke the graph
-        final = self.graph.invoke(state)
+        final = await self.graph.ainvoke(state)
         return {
             "answer": final.get("result"),
             #"trace": final.get("scratchpad", []),
             "agent": final.get("selected_agent"),
             #"steps": [s.__dict__ for s in final["plan"].steps],
         }
+
+    def run(self, user_id: str, query: str, hinted_agent: Optional[str] = None) -> Dict[str, Any]:
+        '''
+        takes user_id, query, optional hinted_agent as input
+        returns final orchestration result with answer, trace, selected_agent, steps
+        '''
+        # Run on the persistent background loop rather than asyncio.run:
+        # a loop per call would close the loop the shared async HTTP pool
+        # opened its keep-alive connections on, forcing a new pool (and
+        # fresh TCP+TLS handshakes) for every request
+        future = asyncio.run_coroutine_threadsafe(
+            self.arun(user_id, query, hinted_agent), background_loop())
+        return future.result()
@@ -6,10 +6,20 @@
 from __future__ import annotations
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass, field
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+from collections import OrderedDict
 from dotenv import load_dotenv
-import json
+import logging
 import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Defense-in-depth for fenced output: guided_json returns raw JSON, but a
+# misconfigured model may still wrap it in a markdown block. One precompiled
+# regex unwraps that case instead of the old split/startswith dance.
+_FENCE_RE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.S)
 
 load_dotenv()
 API_KEY = os.getenv("NVIDIA_API_KEY")
@@ -30,6 +40,11 @@ list_of_agents = {
 
 
 class PlanStep(BaseModel):
+    # Plans are validated once and then only read; frozen gets hashable,
+    # immutable instances and extra="forbid" rejects stray LLM fields at
+    # parse time instead of carrying them around
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     id: int = Field(description="Step number in sequence")
     description: str = Field(description="Clear description of what this step accomplishes")
     agent: str = Field(description="Name of the agent to handle this step")
@@ -38,11 +53,30 @@ class PlanStep(BaseModel):
 
 
 class Plan(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     goal: str = Field(description="The overall objective to achieve")
     rationale: str = Field(description="Why this plan structure was chosen")
     steps: List[PlanStep] = Field(description="Ordered list of steps to execute")
 
 
+# Fallback plan built once at import: under a flaky upstream every parse
+# failure would otherwise re-run full Pydantic validation; model_copy on
+# the frozen template just rebinds the goal
+_FALLBACK_STEP = PlanStep(
+    id=1,
+    description="General advice based on the query.",
+    agent="general_advisor",
+    inputs={},
+    success_criteria="General advice provided without errors.",
+)
+_FALLBACK_TEMPLATE = Plan(
+    goal="",
+    rationale="Fallback plan due to parsing error",
+    steps=[_FALLBACK_STEP],
+)
+
+
 class PlannerAgent:
     """LLM-backed planner that turns a user goal into an executable multi-step plan.
 
@@ -55,8 +89,32 @@ class PlannerAgent:
             reliable plan. These are the list of agents available along with the tools available in them and their description : {list_of_agents}
             Choose the *single best* agent when in doubt. Only include steps that move the goal forward.'''
         )
-        # Pre-compute the JSON schema for guided_json
+        # Pre-compute the JSON schema for guided_json, plus the immutable
+        # request pieces rebuilt on every plan() call otherwise
         self.plan_schema = Plan.model_json_schema()
+        self._extra_body = {"guided_json": self.plan_schema}
+        self._system_msg = {"role": "system", "content": self.system_prompt}
+        # Memoize raw plan JSON per (goal, intent): a repeated query skips
+        # the NIM round trip and only re-runs the cheap parse
+        self._plan_cache: OrderedDict = OrderedDict()
+        self._plan_cache_lock = threading.Lock()
+
+    _PLAN_CACHE_SIZE = 512
+
+    def _cached_plan_text(self, goal: str, intent: Optional[str]) -> Optional[str]:
+        key = (goal, intent or "")
+        with self._plan_cache_lock:
+            text = self._plan_cache.get(key)
+            if text is not None:
+                self._plan_cache.move_to_end(key)
+            return text
+
+    def _store_plan_text(self, goal: str, intent: Optional[str], text: str) -> None:
+        key = (goal, intent or "")
+        with self._plan_cache_lock:
+            self._plan_cache[key] = text
+            if len(self._plan_cache) > self._PLAN_CACHE_SIZE:
+                self._plan_cache.popitem(last=False)
 
     def _parse_plan(self, text: str, intent: Optional[str], goal: str) -> Plan:
         """Parse the LLM's guaranteed JSON response from guided_json.
@@ -67,50 +125,38 @@ class PlannerAgent:
         try:
             # guided_json guarantees valid JSON matching the Plan schema
             text = text.strip()
-            
-            # Extract JSON if wrapped in any markdown or extra text
-            if text.startswith("```"):
-                # Handle markdown code blocks
-                text = text.split("```")[1]
-                if text.startswith("json"):
-                    text = text[4:]
-                text = text.strip()
-            
-            # Parse JSON
-            json_data = json.loads(text)
-            
-            # Validate and construct Plan using Pydantic
-            plan = Plan(**json_data)
-            
-            print(f"[DEBUG from planner.py]: Parsed plan with {len(plan.steps)} steps") #, steps:\n{plan.steps}")
-            print(f"[DEBUG from planner.py]: Full plan JSON:\n{json.dumps(json_data, indent=2)}")
+
+            # Extract JSON if wrapped in a markdown fence despite guided_json
+            fenced = _FENCE_RE.match(text)
+            if fenced:
+                text = fenced.group(1)
+
+            # Parse and validate in one pydantic-core pass: no intermediate
+            # dict, no second field-by-field walk through Plan(**data)
+            plan = Plan.model_validate_json(text)
+
+            logger.debug("Parsed plan with %d steps", len(plan.steps))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Full plan JSON:\n%s", plan.model_dump_json(indent=2))
             return plan
-            
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"[ERROR from planner.py]: Failed to parse plan: {e}")
-            print(f"[DEBUG from planner.py]: Raw text: {text}")
+
+        except ValueError as e:
+            logger.error("Failed to parse plan: %s", e)
+            logger.debug("Raw text: %s", text)
             
             # Fallback: return a safe default plan
-            fallback_plan = Plan(
-                goal=goal,
-                rationale="Fallback plan due to parsing error",
-                steps=[
-                    PlanStep(
-                        id=1,
-                        description="General advice based on the query.",
-                        agent="general_advisor",
-                        inputs={},
-                        success_criteria="General advice provided without errors.",
-                    )
-                ]
-            )
-            print(f"[DEBUG from planner.py]: Using fallback plan with {len(fallback_plan.steps)} steps")
+            fallback_plan = _FALLBACK_TEMPLATE.model_copy(update={"goal": goal})
+            logger.debug("Using fallback plan with %d steps", len(fallback_plan.steps))
             return fallback_plan
 
     def plan(self, goal: str, intent: Optional[str] = None, context: Optional[Dict[str, Any]] = None) -> Plan:
         """Create a structured plan for the given goal using guided_json."""
+        cached = self._cached_plan_text(goal, intent)
+        if cached is not None:
+            return self._parse_plan(cached, intent, goal)
+
         msgs = [
-            {"role": "system", "content": self.system_prompt},
+            self._system_msg,
             {"role": "user", "content": f"Goal: {goal} \nKnown intent: {intent or 'unknown'}"},
         ]
 
@@ -118,12 +164,35 @@ class PlannerAgent:
         resp = self.llm_client.get_chat_model(
             msgs,
             temperature=0.3,
-            guided_json=self.plan_schema
+            extra_body=self._extra_body
         )
         
         text = resp.get("content", "") if isinstance(resp, dict) else str(resp)
         # print(f"[DEBUG from planner.py]: LLM response:\n{text}")
-        
+        self._store_plan_text(goal, intent, text)
+
+        return self._parse_plan(text, intent, goal)
+
+    async def aplan(self, goal: str, intent: Optional[str] = None, context: Optional[Dict[str, Any]] = None) -> Plan:
+        """Async counterpart of plan(); awaits the LLM call instead of blocking."""
+        cached = self._cached_plan_text(goal, intent)
+        if cached is not None:
+            return self._parse_plan(cached, intent, goal)
+
+        msgs = [
+            self._system_msg,
+            {"role": "user", "content": f"Goal: {goal} \nKnown intent: {intent or 'unknown'}"},
+        ]
+
+        resp = await self.llm_client.aget_chat_model(
+            msgs,
+            temperature=0.3,
+            extra_body=self._extra_body
+        )
+
+        text = resp.get("content", "") if isinstance(resp, dict) else str(resp)
+        self._store_plan_text(goal, intent, text)
+
         return self._parse_plan(text, intent, goal)
 
 
@@ -25,17 +25,44 @@ INTENT_MAP = {
     r"\b(fraud|suspicious|chargeback|phishing)\b": "fraud_shield",
 }
 
+# The intent patterns compile once into a single named-group alternation,
+# so routing is one scan of the query instead of a search per pattern.
+# INTENT_MAP order is the priority order: the pass keeps the highest-
+# priority group seen rather than the leftmost match, matching the old
+# per-pattern loop exactly.
+_COMBINED_INTENTS = re.compile(
+    "|".join(f"(?P<{agent}>{pattern})" for pattern, agent in INTENT_MAP.items()),
+    re.I,
+)
+_INTENT_AGENTS = list(INTENT_MAP.values())
+_INTENT_PRIORITY = {agent: i for i, agent in enumerate(_INTENT_AGENTS)}
+
 class RouterAgent:
     def __init__(self, model: str = "gpt-4o-mini"):
         self.llm = get_chat_model(model=model)
 
-    def route(self, query: str, hinted: Optional[str] = None) -> str:
+    def route_fast(self, query: str, hinted: Optional[str] = None) -> Optional[str]:
+        """Regex-only routing: the compiled-pattern pass without the LLM
+        fallback, so callers can probe for a confident match for free and
+        only pay for an LLM classification when none exists."""
         if hinted:
             return hinted
-        for pattern, agent in INTENT_MAP.items():
-            if re.search(pattern, query, re.I):
-                #print(f"[DEBUG from router.py]: Routed by rule: pattern='{pattern}' to agent='{agent}'")
-                return agent
+        best = None
+        for match in _COMBINED_INTENTS.finditer(query):
+            priority = _INTENT_PRIORITY[match.lastgroup]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+        if best is not None:
+            #print(f"[DEBUG from router.py]: Routed by rule to agent='{_INTENT_AGENTS[best]}'")
+            return _INTENT_AGENTS[best]
+        return None
+
+    def route(self, query: str, hinted: Optional[str] = None) -> str:
+        agent = self.route_fast(query, hinted)
+        if agent is not None:
+            return agent
         # fallback to LLM classification
         msgs = [
             {"role": "system", "content": "Return only the best agent key from: fin_score, credits_loans, investment_coach, insurance_analyzer, retirement_planner, tax_planner, fraud_shield, fin_advisor."},
@@ -3,45 +3,138 @@
 # Description: Load user profile & transactions from /data
 # ==============================================
 from __future__ import annotations
-import json
+import orjson
 import csv
+import logging
+import numpy as np
+import threading
+import time
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 DATA_DIR = Path(__file__).resolve().parents[2] / "data"
 
+logger = logging.getLogger(__name__)
+
+# In-process TTL caches: every graph run calls both loaders, so repeats
+# within the TTL become a dict lookup instead of a re-open and re-parse.
+# Entries also carry the source file's mtime and invalidate when it moves.
+TTL_SECONDS = 60.0
+_PROFILE_CACHE: Dict[str, Tuple[float, Optional[float], Any]] = {}
+_TX_CACHE: Dict[str, Tuple[float, Optional[float], Any]] = {}
+_TX_SOA_CACHE: Dict[str, Tuple[float, Optional[float], Any]] = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def _file_mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+def _cache_get(cache: Dict[str, Tuple[float, Optional[float], Any]],
+               user_id: str, mtime: Optional[float]) -> Optional[Any]:
+    with _CACHE_LOCK:
+        entry = cache.get(user_id)
+        if entry is not None:
+            loaded_at, cached_mtime, value = entry
+            if time.monotonic() - loaded_at < TTL_SECONDS and cached_mtime == mtime:
+                return value
+    return None
+
+
+def _cache_put(cache: Dict[str, Tuple[float, Optional[float], Any]],
+               user_id: str, mtime: Optional[float], value: Any) -> None:
+    with _CACHE_LOCK:
+        cache[user_id] = (time.monotonic(), mtime, value)
+
 
 def load_user_profile(user_id: str) -> Dict[str, Any]:
     profile_path = DATA_DIR / "dummy_user.json"
-    if profile_path.exists():
-        with open(profile_path, "r", encoding="utf-8") as f:
-            prof = json.load(f)
-            # If file contains many, pick by id; else return same stub with override
-            if isinstance(prof, dict) and prof.get("user_id"):
-                print(f"[DEBUG from data_loader.py]: Loaded profile for user_id={user_id} from dummy_user.json")
-                return prof
-    # fallback stub
-    return {"user_id": user_id, "name": "Demo User", "age": 35, "risk_profile": "moderate"}
+    mtime = _file_mtime(profile_path)
+
+    cached = _cache_get(_PROFILE_CACHE, user_id, mtime)
+    if cached is not None:
+        return cached
+
+    prof = None
+    if mtime is not None:
+        data = orjson.loads(profile_path.read_bytes())
+        # If file contains many, pick by id; else return same stub with override
+        if isinstance(data, dict) and data.get("user_id"):
+            logger.debug("Loaded profile for user_id=%s from dummy_user.json", user_id)
+            prof = data
+    if prof is None:
+        # fallback stub
+        prof = {"user_id": user_id, "name": "Demo User", "age": 35, "risk_profile": "moderate"}
+
+    _cache_put(_PROFILE_CACHE, user_id, mtime, prof)
+    return prof
 
 
 def load_user_transactions(user_id: str) -> List[Dict[str, Any]]:
     tx_path = DATA_DIR / "dummy_transactions.csv"
+    mtime = _file_mtime(tx_path)
+
+    cached = _cache_get(_TX_CACHE, user_id, mtime)
+    if cached is not None:
+        return cached
+
     rows: List[Dict[str, Any]] = []
-    if tx_path.exists():
+    if mtime is not None:
         with open(tx_path, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for r in reader:
-                rows.append({
-                    "tx_id": r.get("tx_id"),
-                    "amount": float(r.get("amount", 0) or 0),
-                    "type": r.get("type", "expense"),
-                    "category": r.get("category", "misc"),
-                    "date": r.get("date"),
-                })
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header:
+                # Positional indexing: csv.reader skips the per-row dict
+                # DictReader builds, and column lookup happens once on the
+                # header instead of per field per row
+                idx = {name: i for i, name in enumerate(header)}
+                i_tx, i_amount = idx.get("tx_id"), idx.get("amount")
+                i_type, i_category, i_date = idx.get("type"), idx.get("category"), idx.get("date")
+                rows = [{
+                    "tx_id": row[i_tx] if i_tx is not None else None,
+                    "amount": float(row[i_amount]) if i_amount is not None and row[i_amount] else 0.0,
+                    "type": row[i_type] if i_type is not None else "expense",
+                    "category": row[i_category] if i_category is not None else "misc",
+                    "date": row[i_date] if i_date is not None else None,
+                } for row in reader]
     if not rows:
         rows = [
             {"tx_id": "t1", "amount": 2500.0, "type": "expense", "category": "groceries", "date": "2025-08-01"},
             {"tx_id": "t2", "amount": 60000.0, "type": "income", "category": "salary", "date": "2025-08-01"},
         ]
+
+    _cache_put(_TX_CACHE, user_id, mtime, rows)
     return rows
 
+
+def load_user_transactions_soa(user_id: str) -> Dict[str, np.ndarray]:
+    """Columnar (struct-of-arrays) view of the user's transactions.
+
+    Aggregating agents scan one contiguous typed column instead of a list
+    of heterogeneous dicts, so reductions like
+    ``soa["amount"][soa["type"] == "expense"].sum()`` run vectorized in C.
+    Amounts are float32: half the scan bandwidth of float64 and plenty of
+    range for transaction values. Cached with the same TTL+mtime policy
+    as the row loader, so the arrays are built once per file version.
+    """
+    tx_path = DATA_DIR / "dummy_transactions.csv"
+    mtime = _file_mtime(tx_path)
+
+    cached = _cache_get(_TX_SOA_CACHE, user_id, mtime)
+    if cached is not None:
+        return cached
+
+    rows = load_user_transactions(user_id)
+    soa = {
+        "tx_id": np.asarray([r["tx_id"] for r in rows], dtype=object),
+        "amount": np.asarray([r["amount"] for r in rows], dtype=np.float32),
+        "type": np.asarray([r["type"] for r in rows]),
+        "category": np.asarray([r["category"] for r in rows]),
+        "date": np.asarray([r["date"] for r in rows], dtype="datetime64[D]"),
+    }
+
+    _cache_put(_TX_SOA_CACHE, user_id, mtime, soa)
+    return soa
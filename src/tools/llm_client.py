@@ -1,18 +1,128 @@
 from typing import List, Dict, Any, Optional
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
+import asyncio
+import httpx
 import os
+import threading
 
 
 load_dotenv()
 API_KEY = os.getenv("NVIDIA_API_KEY")
 
+# h2 is an optional httpx extra that nothing in this tree declares; fall
+# back to HTTP/1.1 keep-alive when it is missing instead of raising at
+# client construction
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# Shared connection pools: the planner and every agent hit the same NIM
+# host, so reusing a pool skips the TCP+TLS handshake per client and lets
+# concurrent fan-out calls multiplex on already-open connections. Built
+# lazily so importing this module opens no sockets. The sync pool is one
+# per process; async connections are bound to the event loop they were
+# opened on, and Orchestrator.run() starts a fresh loop per call via
+# asyncio.run, so a single shared async pool would hand a dead loop's
+# connection to the next call ("Event loop is closed") - async pools are
+# therefore keyed by the running loop.
+_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=64)
+_HTTP_LOCK = threading.Lock()
+_HTTP_CLIENT: Optional[httpx.Client] = None
+_AHTTP_CLIENTS: Dict[Any, httpx.AsyncClient] = {}
+_BACKGROUND_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """Long-lived event loop on a daemon thread for sync entry points.
+
+    Submitting orchestrations here (asyncio.run_coroutine_threadsafe)
+    instead of asyncio.run keeps one loop alive for the whole process, so
+    the per-loop async HTTP pool above is opened once and its keep-alive
+    connections actually survive across requests.
+    """
+    global _BACKGROUND_LOOP
+    with _LOOP_LOCK:
+        if _BACKGROUND_LOOP is None or _BACKGROUND_LOOP.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever,
+                             name="llm-background-loop", daemon=True).start()
+            _BACKGROUND_LOOP = loop
+        return _BACKGROUND_LOOP
+
+
+def _release_async_client(client: httpx.AsyncClient) -> None:
+    # Deterministic release for a client whose owning loop is already
+    # closed: run aclose() on the background loop so keep-alive sockets
+    # are freed promptly instead of at GC finalization. Fire-and-forget -
+    # blocking on the result from the background loop's own thread would
+    # stall the loop that has to run the close.
+    try:
+        loop = background_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(client.aclose())
+        else:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    except Exception:
+        pass
+
+
+def _shared_http_client() -> httpx.Client:
+    global _HTTP_CLIENT
+    with _HTTP_LOCK:
+        if _HTTP_CLIENT is None:
+            _HTTP_CLIENT = httpx.Client(http2=_HTTP2, limits=_LIMITS, timeout=60)
+        return _HTTP_CLIENT
+
+
+def _async_http_client_for_loop() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    stale_clients = []
+    with _HTTP_LOCK:
+        client = _AHTTP_CLIENTS.get(loop)
+        if client is None:
+            for stale in [l for l in _AHTTP_CLIENTS if l.is_closed()]:
+                stale_clients.append(_AHTTP_CLIENTS.pop(stale))
+            client = httpx.AsyncClient(http2=_HTTP2, limits=_LIMITS, timeout=60)
+            _AHTTP_CLIENTS[loop] = client
+    for stale_client in stale_clients:
+        _release_async_client(stale_client)
+    return client
+
 
 class LLMClient:
+    # Process-wide default instance for get_default(); distinct explicit
+    # instances remain possible but share the transport pool above anyway
+    _default: Optional["LLMClient"] = None
+    _default_lock = threading.Lock()
+
     def __init__(self):
-        self.client = OpenAI(base_url="https://integrate.api.nvidia.com/v1", api_key=API_KEY)
+        self.client = OpenAI(base_url="https://integrate.api.nvidia.com/v1", api_key=API_KEY,
+                             http_client=_shared_http_client())
+        # AsyncOpenAI wrappers per event loop, matching the per-loop
+        # async pools above; built on first await in each loop
+        self._aclients: Dict[Any, AsyncOpenAI] = {}
         self.default_model = "nvidia/llama-3.3-nemotron-super-49b-v1.5"
 
+    @property
+    def aclient(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None:
+            for stale in [l for l in self._aclients if l.is_closed()]:
+                del self._aclients[stale]
+            client = AsyncOpenAI(base_url="https://integrate.api.nvidia.com/v1", api_key=API_KEY,
+                                 http_client=_async_http_client_for_loop())
+            self._aclients[loop] = client
+        return client
+
     def get_chat_model(
         self,
         prompt: List[Dict[str, str]],
@@ -20,24 +130,28 @@ class LLMClient:
         max_tokens: int = 4096,
         temperature: float = 0.7,
         guided_json: Optional[Dict[str, Any]] = None,
+        extra_body: Optional[Dict[str, Any]] = None,
         **kwargs: Any
     ) -> Dict[str, Any]:
         """
         Call NVIDIA NIM LLM with support for structured outputs via guided_json.
-        
+
         Args:
             prompt: List of message dictionaries with 'role' and 'content'
             model: Model name (defaults to default_model)
             max_tokens: Maximum tokens in response
             temperature: Sampling temperature (0.0 to 2.0)
             guided_json: JSON schema for structured output (enables guided_json)
+            extra_body: Prebuilt extra_body dict; passed through as-is so hot
+                callers can reuse one immutable template instead of
+                rebuilding the guided_json nesting per call
             **kwargs: Additional parameters to pass to the API
-            
+
         Returns:
             Dict with response data including 'content' field
         """
         model = model or self.default_model
-        
+
         # Build the base request parameters
         request_params = {
             "model": model,
@@ -45,9 +159,11 @@ class LLMClient:
             "max_tokens": max_tokens,
             "temperature": temperature,
         }
-        
-        # Add extra_body parameters if guided_json is provided
-        if guided_json is not None:
+
+        # Add extra_body parameters if provided (prebuilt takes precedence)
+        if extra_body is not None:
+            request_params["extra_body"] = extra_body
+        elif guided_json is not None:
             request_params["extra_body"] = {"guided_json": guided_json}
         
         # Add any additional kwargs
@@ -64,6 +180,56 @@ class LLMClient:
             "raw_response": response
         }
     
+    async def aget_chat_model(
+        self,
+        prompt: List[Dict[str, str]],
+        model: Optional[str] = None,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        guided_json: Optional[Dict[str, Any]] = None,
+        extra_body: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        """
+        Async variant of get_chat_model; awaiting instead of blocking lets
+        the orchestrator overlap concurrent LLM calls on one event loop.
+
+        Same arguments and return shape as get_chat_model.
+        """
+        model = model or self.default_model
+
+        request_params = {
+            "model": model,
+            "messages": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+
+        if extra_body is not None:
+            request_params["extra_body"] = extra_body
+        elif guided_json is not None:
+            request_params["extra_body"] = {"guided_json": guided_json}
+
+        request_params.update(kwargs)
+
+        response = await self.aclient.chat.completions.create(**request_params)
+
+        return {
+            "content": response.choices[0].message.content,
+            "model": response.model,
+            "usage": response.usage,
+            "raw_response": response
+        }
+
+    @classmethod
+    def get_default(cls) -> "LLMClient":
+        """Return the shared process-wide client, constructing it on first
+        use so importing callers do not open connections at load time."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
     def get_default_model(self) -> str:
         """Get the default model name."""
         return self.default_model